@@ -0,0 +1,270 @@
+"""End-to-end benchmark of the bot's message handling without Discord or OpenAI.
+
+Synthetic channel traffic is replayed through ``on_message``, the reply
+coalescer and job queue (and so ``reply_as_npc``/``reply_as_npcs``), with
+the ambient post job firing periodically. OpenAI calls go to a local
+fake Responses API server with configurable latency. For every roster
+size and message rate it reports throughput, p50/p99 reply latency
+measured from message arrival to the finished reply, and event-loop lag.
+
+    python benchmarks/bench_bot.py
+    python benchmarks/bench_bot.py --npcs 10,1000 --rates 2,20 --duration 20 --latency 1.0
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from fake_backends import FakeAuthor, FakeChannel, FakeMessage, FakeResponsesServer
+from metrics import AMBIENT_DECISIONS
+
+BENCH_CHANNEL_ID = 424242
+# Passed to the app instead of the process environment; none is used for real.
+BENCH_ENV = {
+    "DISCORD_TOKEN": "benchmark",
+    "OPENAI_API_KEY": "benchmark",
+    "CHANNEL_ID": str(BENCH_CHANNEL_ID),
+    "PING_CHANNEL_ID": str(BENCH_CHANNEL_ID + 1),
+    "WEB_USERNAME": "benchmark",
+    "WEB_PASSWORD": "benchmark",
+}
+
+
+WORDS = (
+    "der Dschungel ist heute still und ich frage mich ob jemand kommt wir sollten weiter "
+    "zum Fluss gehen bevor es dunkel wird hast du das gehört"
+).split()
+PLAYERS = ("Aria", "Borin", "Cael", "Dara", "Eron")
+
+
+def make_names(count: int, rng: random.Random) -> list[str]:
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(string.ascii_uppercase) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return sorted(names)
+
+
+def make_prompt_data(npc_names: list[str], rng: random.Random) -> dict:
+    def text(words: int) -> str:
+        return " ".join(rng.choices(WORDS, k=words))
+
+    return {
+        "core": "Du bist der Erzähler einer Dschungelkampagne. " + text(150),
+        "welt": "\n\n".join(text(120) for _ in range(20)),
+        "spieler": [{"name": f"{p} Sturmwind", "info": text(30)} for p in PLAYERS],
+        "tiere": [{"name": "Papagei", "info": text(20)}],
+        "npc": [{"name": f"{n} vom Fluss", "short": text(15), "long": text(200)} for n in npc_names],
+        "events": [],
+        "weather_table": {str(i): f"Wetter {i}" for i in range(1, 21)},
+        "user_list": {**{p.lower(): f"{p} Sturmwind" for p in PLAYERS}, "dm-helfer": "Erzähler", "dicebot": "Würfelbot"},
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def waking_hour(settings: bot.Settings) -> int:
+    return next(h for h in range(24) if not settings.silent_hours_start <= h <= settings.silent_hours_end)
+
+
+class Scenario:
+    def __init__(self, npc_count: int, rate: float, args, base_url: str, workdir: str) -> None:
+        self.npc_count = npc_count
+        self.rate = rate
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.npc_names = make_names(npc_count, self.rng)
+        self.bot_user = FakeAuthor("dm-helfer", bot=True)
+        self.channel = FakeChannel(BENCH_CHANNEL_ID, self.bot_user, self.echo)
+        self.players = [FakeAuthor(p.lower()) for p in PLAYERS]
+        self.latencies: list[float] = []
+        self.lag: list[float] = []
+        self.expected = 0
+        self.sent = 0
+        self.tasks: set[asyncio.Task] = set()
+        name = f"{npc_count}_{rate}"
+        with open(os.path.join(workdir, f"prompt_data_{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_prompt_data(self.npc_names, self.rng), f, ensure_ascii=False)
+        self.app = bot.create_app(workdir, self.config(name, args, base_url), BENCH_ENV)
+        self.app.client.get_channel = {BENCH_CHANNEL_ID: self.channel}.get
+        # Build the lazy parts up front so their imports and loading do not
+        # show up as event-loop lag.
+        self.app.llm
+        self.app.campaigns.default
+
+    def config(self, name: str, args, base_url: str) -> dict:
+        config = bot.load_config()
+        config["data_paths"].update({
+            "prompt_data": f"prompt_data_{name}.json",
+            "backend": "json",
+            "scheduler_state": f"scheduler_state_{name}.json",
+        })
+        config["openai"].update({"base_url": base_url, "streaming": args.streaming})
+        config["discord"].update({
+            "reply_debounce_seconds": args.debounce,
+            "post_probability_percent": 100,
+            "min_seconds_since_user_post": 0,
+        })
+        config["campaigns"] = []
+        config["response_cache"] = {"path": f"response_cache_{name}", "ttl_hours": 1, "max_entries": 100}
+        return config
+
+    def echo(self, message: FakeMessage) -> None:
+        # Discord delivers the bot's own posts back to on_message.
+        self.spawn(self.app.on_message(message))
+
+    def spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def make_message(self) -> tuple[FakeMessage, bool]:
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.05:
+            return FakeMessage(self.channel, self.rng.choice(self.players), ">> kurz afk"), False
+        if roll < 0.10:
+            return FakeMessage(self.channel, FakeAuthor("dicebot", bot=True), "Wurf: 17"), False
+        words = rng.choices(WORDS, k=rng.randint(6, 30))
+        mentions = 0
+        if rng.random() < self.args.mention_rate:
+            mentions = 2 if rng.random() < 0.25 else 1
+        for name in rng.sample(self.npc_names, mentions):
+            words.insert(rng.randrange(len(words) + 1), name)
+        return FakeMessage(self.channel, rng.choice(self.players), " ".join(words)), mentions > 0
+
+    async def measure_lag(self, interval: float = 0.01) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.lag.append(loop.time() - started - interval)
+
+    async def ambient(self) -> None:
+        now = datetime.now().replace(hour=waking_hour(self.app.settings), minute=0)
+        while True:
+            await asyncio.sleep(self.args.ambient_interval)
+            await self.app.ambient_job(now)
+
+    async def run(self) -> dict:
+        app = self.app
+        app.job_queue.start()
+        original_reply = app.reply_to_triggers
+
+        async def timed_reply(npc_names, trigger_messages):
+            try:
+                await original_reply(npc_names, trigger_messages)
+            finally:
+                done = time.perf_counter()
+                self.latencies += [done - m.received_at for m in trigger_messages]
+
+        app.reply_to_triggers = timed_reply
+        ambient_before = AMBIENT_DECISIONS.value(job="ambient", decision="posted")
+        lag_task = asyncio.create_task(self.measure_lag())
+        ambient_task = asyncio.create_task(self.ambient())
+        started = time.perf_counter()
+        try:
+            while time.perf_counter() - started < self.args.duration:
+                await asyncio.sleep(self.rng.expovariate(self.rate))
+                message, triggers = self.make_message()
+                self.channel.add(message)
+                message.received_at = time.perf_counter()
+                self.expected += triggers
+                self.sent += 1
+                self.spawn(self.app.on_message(message))
+            ambient_task.cancel()
+            deadline = time.perf_counter() + self.args.drain_timeout
+            while len(self.latencies) < self.expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+        finally:
+            ambient_task.cancel()
+            lag_task.cancel()
+            await app.job_queue.stop()
+            app.campaigns.close()
+        return {
+            "npcs": self.npc_count,
+            "rate": self.rate,
+            "messages": self.sent,
+            "triggers": self.expected,
+            "answered": len(self.latencies),
+            "throughput": len(self.latencies) / elapsed,
+            "p50": percentile(self.latencies, 0.5),
+            "p99": percentile(self.latencies, 0.99),
+            "lag_p50": percentile(self.lag, 0.5),
+            "lag_p99": percentile(self.lag, 0.99),
+            "lag_max": max(self.lag, default=0.0),
+            "posts": len(self.channel.sent),
+            "ambient": AMBIENT_DECISIONS.value(job="ambient", decision="posted") - ambient_before,
+        }
+
+
+async def run_all(args, server: FakeResponsesServer, workdir: str) -> None:
+    workers = bot.Settings(bot.load_config()).job_workers
+    print(f"fake OpenAI latency {args.latency:.2f}s + up to {args.jitter:.2f}s, "
+          f"{workers} job workers, debounce {args.debounce:.1f}s, streaming {args.streaming}")
+    print(f"{'NPCs':>6} {'msg/s':>6} {'msgs':>5} {'trig':>5} {'done':>5} {'replies/s':>9} "
+          f"{'p50 s':>7} {'p99 s':>7} {'lag p50 ms':>10} {'lag p99 ms':>10} {'lag max ms':>10} {'posts':>5} {'amb':>4}")
+    for npc_count in args.npcs:
+        for rate in args.rates:
+            requests_before = server.requests
+            # generate_and_send prints every post; keep the report readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = await Scenario(npc_count, rate, args, server.url, workdir).run()
+            print(f"{result['npcs']:>6} {result['rate']:>6g} {result['messages']:>5} {result['triggers']:>5} "
+                  f"{result['answered']:>5} {result['throughput']:>9.2f} {result['p50']:>7.2f} {result['p99']:>7.2f} "
+                  f"{result['lag_p50'] * 1000:>10.2f} {result['lag_p99'] * 1000:>10.2f} "
+                  f"{result['lag_max'] * 1000:>10.2f} {result['posts']:>5} {result['ambient']:>4}"
+                  f"   ({server.requests - requests_before} OpenAI requests)")
+
+
+def parse_list(value: str, kind):
+    return [kind(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--npcs", type=lambda v: parse_list(v, int), default=[10, 100, 1000])
+    parser.add_argument("--rates", type=lambda v: parse_list(v, float), default=[1, 5, 20],
+                        help="messages per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic per scenario")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--none-rate", type=float, default=0.1, help="share of [none] replies")
+    parser.add_argument("--mention-rate", type=float, default=0.3, help="share of messages naming an NPC")
+    parser.add_argument("--debounce", type=float, default=0.0, help="reply debounce in seconds")
+    parser.add_argument("--ambient-interval", type=float, default=2.0, help="seconds between ambient job runs")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+    server = FakeResponsesServer(args.latency, args.jitter, args.none_rate, args.seed)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            asyncio.run(run_all(args, server, workdir))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
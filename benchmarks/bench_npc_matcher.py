@@ -0,0 +1,75 @@
+"""Micro-benchmark for NPC detection in channel messages.
+
+Compares the previous per-name regex scan with the precompiled
+NpcMatcher at different roster sizes.
+
+    python benchmarks/bench_npc_matcher.py
+"""
+import os
+import random
+import re
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npc_matcher import NpcMatcher
+
+ROSTER_SIZES = (10, 100, 1000)
+MESSAGES = 200
+
+
+def legacy_find(npc_list, content):
+    def mentioned(npc):
+        pattern = re.compile(rf"\b{re.escape(npc)}\b", re.IGNORECASE)
+        for match in pattern.finditer(content):
+            i = match.start() - 1
+            while i >= 0 and content[i].isspace():
+                i -= 1
+            if i >= 0 and content[i] == "~":
+                continue
+            return True
+        return False
+
+    return sorted({npc for npc in npc_list if mentioned(npc)})
+
+
+def make_names(count, rng):
+    names = set()
+    while len(names) < count:
+        length = rng.randint(4, 10)
+        names.add(rng.choice(string.ascii_uppercase) + "".join(rng.choices(string.ascii_lowercase, k=length)))
+    return sorted(names)
+
+
+def make_messages(names, rng):
+    words = ["der", "Dschungel", "ist", "heute", "still", "und", "ich", "frage", "mich", "ob", "jemand", "kommt"]
+    messages = []
+    for _ in range(MESSAGES):
+        text = rng.choices(words, k=rng.randint(8, 40))
+        for _ in range(rng.randint(0, 2)):
+            name = rng.choice(names)
+            text.insert(rng.randrange(len(text) + 1), ("~ " if rng.random() < 0.2 else "") + name)
+        messages.append(" ".join(text))
+    return messages
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'NPCs':>6} {'legacy µs/msg':>14} {'matcher µs/msg':>15} {'speedup':>8}")
+    for size in ROSTER_SIZES:
+        names = make_names(size, rng)
+        messages = make_messages(names, rng)
+        matcher = NpcMatcher(names)
+        for msg in messages:
+            assert matcher.find(msg) == legacy_find(names, msg)
+
+        legacy = timeit.timeit(lambda: [legacy_find(names, m) for m in messages], number=3)
+        fast = timeit.timeit(lambda: [matcher.find(m) for m in messages], number=3)
+        per_msg = 1e6 / (3 * len(messages))
+        print(f"{size:>6} {legacy * per_msg:>14.1f} {fast * per_msg:>15.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Stand-ins for Discord and the OpenAI Responses API used by the benchmarks.
+
+``FakeResponsesServer`` is a real HTTP server on localhost, so requests go
+through the OpenAI SDK, its connection pool and JSON parsing just like in
+production. It runs its own event loop in a background thread and does
+not compete with the bot's loop for time.
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+
+from aiohttp import web
+import discord
+
+REPLY_WORDS = (
+    "Der Nebel hängt tief über dem Pfad, und irgendwo knackt ein Ast. Ich halte inne, "
+    "lausche und lege die Hand an den Griff meines Messers, bevor ich weitergehe."
+).split()
+
+
+class FakeResponsesServer:
+    """Serves ``POST /v1/responses`` with canned replies after a delay.
+
+    Each request waits ``latency`` seconds plus up to ``jitter`` random
+    seconds. A ``none_rate`` share of replies is just the ``[none]``
+    sentinel. Streaming requests are answered as server-sent events with
+    one delta per word. Errors queued in ``errors`` as ``(status,
+    headers)`` answer the next requests, one each, before replies resume.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, none_rate: float = 0.1, seed: int = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.none_rate = none_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors: list[tuple[int, dict]] = []
+        self.url = ""
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> str:
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(ready,), name="fake-openai", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def _serve(self, ready: threading.Event) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/v1/responses", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1"
+        ready.set()
+        self._loop.run_forever()
+
+    def _reply(self) -> str:
+        if self.rng.random() < self.none_rate:
+            return "[none]"
+        return " ".join(self.rng.choices(REPLY_WORDS, k=self.rng.randint(15, 60)))
+
+    def _response(self, body: dict, text: str, input_chars: int) -> dict:
+        input_tokens = input_chars // 4 + 1
+        output_tokens = len(text) // 4 + 1
+        return {
+            "id": f"resp_{self.requests}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": body.get("model", "fake"),
+            "output": [{
+                "type": "message",
+                "id": f"msg_{self.requests}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        raw = await request.read()
+        body = json.loads(raw)
+        self.requests += 1
+        if self.errors:
+            status, headers = self.errors.pop(0)
+            error = {"error": {"message": f"fake error {status}", "type": "fake_error", "param": None, "code": None}}
+            return web.json_response(error, status=status, headers=headers)
+        text = self._reply()
+        await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        response = self._response(body, text, len(raw))
+        if not body.get("stream"):
+            return web.json_response(response)
+
+        stream = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await stream.prepare(request)
+        sequence = itertools.count()
+
+        async def send(event: dict) -> None:
+            event["sequence_number"] = next(sequence)
+            await stream.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+
+        await send({"type": "response.created", "response": dict(response, status="in_progress", output=[])})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            await send({
+                "type": "response.output_text.delta",
+                "item_id": f"msg_{self.requests}",
+                "output_index": 0,
+                "content_index": 0,
+                "delta": word if i == 0 else " " + word,
+                "logprobs": [],
+            })
+        await send({"type": "response.completed", "response": response})
+        await stream.write_eof()
+        return stream
+
+
+class FakeAuthor:
+    def __init__(self, name: str, bot: bool = False, roles=()) -> None:
+        self.name = name
+        self.bot = bot
+        self.roles = list(roles)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeMessage:
+    _ids = itertools.count(1_000_000)
+
+    def __init__(self, channel: "FakeChannel", author: FakeAuthor, content: str) -> None:
+        self.id = next(self._ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.created_at = discord.utils.utcnow()
+        self.received_at = 0.0
+
+    async def edit(self, content: str) -> "FakeMessage":
+        self.content = content
+        return self
+
+    async def delete(self) -> None:
+        self.channel.deleted += 1
+
+
+class FakeChannel:
+    """Text channel that records what the bot posts.
+
+    ``on_send`` is called with every message the bot sends, which lets the
+    harness echo it back through ``on_message`` like Discord does.
+    """
+
+    def __init__(self, channel_id: int, bot_user: FakeAuthor, on_send=None) -> None:
+        self.id = channel_id
+        self.bot_user = bot_user
+        self.on_send = on_send
+        self.messages: list[FakeMessage] = []
+        self.sent: list[FakeMessage] = []
+        self.deleted = 0
+
+    def add(self, message: FakeMessage) -> None:
+        self.messages.append(message)
+
+    async def send(self, content: str) -> FakeMessage:
+        message = FakeMessage(self, self.bot_user, content)
+        self.messages.append(message)
+        self.sent.append(message)
+        if self.on_send is not None:
+            self.on_send(message)
+        return message
+
+    async def history(self, limit: int = 100, before=None):
+        before_id = getattr(before, "id", None)
+        count = 0
+        for message in reversed(self.messages):
+            if before_id is not None and message.id >= before_id:
+                continue
+            if count >= limit:
+                return
+            count += 1
+            yield message
@@ -1,39 +1,146 @@
+from __future__ import annotations
+
 import os
+import signal
+import asyncio
 import random
 import logging
+import logging.handlers
 import json
-import re
-from datetime import datetime
-from threading import Thread
-from dotenv import load_dotenv
-from openai import OpenAI
-import discord
-from discord.ext import tasks
-from discord import app_commands
-import web
+import atexit
+import hashlib
+import time
+from contextlib import aclosing
+from datetime import date, datetime, timedelta, timezone
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+from log_files import RotatingLogHandler
+from log_queue import JsonFormatter, LogQueueHandler
+from persistence import JsonPersistence, SqlitePersistence
+from channel_buffer import BufferedMessage, ChannelBuffer
+from reply_coalescer import ReplyCoalescer
+from response_cache import ResponseCache
+from token_budget import count_tokens
+from conversation_memory import ConversationMemory
+from campaign import Campaign, CampaignRegistry
+from scheduler_state import SchedulerState
+from scheduler import Scheduler, daily, every_hours
+from metrics import (
+    GENERATE_SECONDS, RESPONSE_CACHE_LOOKUPS, HISTORY_SECONDS, NPC_MATCH_SECONDS, MESSAGES, AMBIENT_DECISIONS,
+)
+from job_queue import JobQueue, PRIORITY_ADMIN, PRIORITY_REPLY, PRIORITY_AMBIENT
+
+if TYPE_CHECKING:
+    import discord
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-with open(os.path.join(BASE_DIR, "config.json"), "r", encoding="utf-8") as f:
-    CONFIG = json.load(f)
 
-LOG_DIR = os.path.join(BASE_DIR, CONFIG["logging"]["log_dir"])
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_LEVEL = getattr(logging, CONFIG["logging"]["log_level"].upper(), logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_config(base_dir: str = BASE_DIR) -> dict:
+    with open(os.path.join(base_dir, "config.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
 
-PROMPT_DATA_PATH = os.path.join(BASE_DIR, CONFIG["data_paths"]["prompt_data"])
-OPENAI_MODEL = CONFIG["openai"]["model"]
-OPENAI_MAX_TOKENS = CONFIG["openai"]["max_tokens"]
-UPDATE_FILE_PATH = os.path.join(BASE_DIR, "update.txt")
 
-TASK_INTERVAL_HOURS = CONFIG["discord"]["task_interval_hours"]
-DAILY_WEATHER_HOUR = CONFIG["discord"]["daily_weather_hour"]
-SILENT_HOURS_START, SILENT_HOURS_END = CONFIG["discord"]["silent_hours"]
-POST_PROBABILITY = CONFIG["discord"]["post_probability_percent"] / 100.0
-MIN_SECONDS_SINCE_USER_POST = CONFIG["discord"]["min_seconds_since_user_post"]
-CONTEXT_MESSAGE_LIMIT = CONFIG["discord"]["context_message_limit"]
+class Settings:
+    """The values the bot reads from ``config.json``, with their defaults.
+
+    Relative paths are resolved against ``base_dir``.
+    """
+
+    def __init__(self, config: dict, base_dir: str = BASE_DIR) -> None:
+        def path(value: str) -> str:
+            return os.path.join(base_dir, value)
+
+        logging_cfg = config["logging"]
+        self.log_dir = path(logging_cfg["log_dir"])
+        self.log_level = getattr(logging, logging_cfg["log_level"].upper(), logging.INFO)
+        self.log_max_bytes = logging_cfg.get("max_bytes", 10 * 1024 * 1024)
+        self.log_backup_count = logging_cfg.get("backup_count", 7)
+        self.log_format = logging_cfg.get("format", "text")
+        self.log_queue_size = logging_cfg.get("queue_size", 10000)
+
+        data_paths = config["data_paths"]
+        self.prompt_data_path = path(data_paths["prompt_data"])
+        self.save_debounce_seconds = data_paths.get("save_debounce_seconds", 2.0)
+        self.storage_backend = data_paths.get("backend", "json")
+        self.sqlite_path = path(data_paths.get("sqlite_path", "./data/prompt_data.sqlite3"))
+        self.scheduler_state_path = path(data_paths.get("scheduler_state", "./data/scheduler_state.json"))
+
+        openai_cfg = config["openai"]
+        self.openai_model = openai_cfg["model"]
+        self.openai_max_tokens = openai_cfg["max_tokens"]
+        self.openai_max_concurrent_requests = openai_cfg.get("max_concurrent_requests", 4)
+        self.prompt_cache_size = openai_cfg.get("prompt_cache_size", 64)
+        self.prompt_token_budget = openai_cfg.get("prompt_token_budget", 0)
+        self.history_token_budget = openai_cfg.get("history_token_budget", 0)
+        self.openai_base_url = openai_cfg.get("base_url")
+        self.openai_streaming = openai_cfg.get("streaming", False)
+        self.stream_edit_interval_seconds = openai_cfg.get("stream_edit_interval_seconds", 1.5)
+        self.stream_min_chars = openai_cfg.get("stream_min_chars", 20)
+        self.openai_max_retries = openai_cfg.get("max_retries", 4)
+        self.openai_requests_per_minute = openai_cfg.get("requests_per_minute", 0)
+        self.openai_tokens_per_minute = openai_cfg.get("tokens_per_minute", 0)
+        self.openai_breaker_threshold = openai_cfg.get("circuit_breaker_threshold", 3)
+        self.openai_breaker_cooldown = openai_cfg.get("circuit_breaker_cooldown_seconds", 300)
+        self.update_file_path = path("update.txt")
+
+        discord_cfg = config["discord"]
+        self.task_interval_hours = discord_cfg["task_interval_hours"]
+        self.daily_weather_hour = discord_cfg["daily_weather_hour"]
+        self.silent_hours_start, self.silent_hours_end = discord_cfg["silent_hours"]
+        self.post_probability = discord_cfg["post_probability_percent"] / 100.0
+        self.min_seconds_since_user_post = discord_cfg["min_seconds_since_user_post"]
+        self.context_message_limit = discord_cfg["context_message_limit"]
+        self.message_buffer_size = discord_cfg.get("message_buffer_size", 50)
+        self.reply_debounce_seconds = discord_cfg.get("reply_debounce_seconds", 0)
+        self.reply_max_wait_seconds = discord_cfg.get("reply_max_wait_seconds", 15)
+        self.campaign_idle_minutes = discord_cfg.get("campaign_idle_minutes", 60)
+        self.discord_sharded = discord_cfg.get("sharded", False)
+        self.discord_shard_count = discord_cfg.get("shard_count")
+        self.campaigns = [
+            (
+                int(entry["channel_id"]),
+                path(entry["prompt_data"]),
+                path(entry.get("sqlite_path", os.path.splitext(entry["prompt_data"])[0] + ".sqlite3")),
+            )
+            for entry in config.get("campaigns", [])
+        ]
+
+        response_cache = config.get("response_cache", {})
+        self.response_cache_dir = path(response_cache.get("path", "./data/response_cache"))
+        self.response_cache_ttl_hours = response_cache.get("ttl_hours", 48)
+        self.response_cache_max_entries = response_cache.get("max_entries", 200)
+
+        retrieval = config.get("retrieval", {})
+        self.retrieval_top_k = retrieval.get("top_k", 0)
+        self.retrieval_chunk_chars = retrieval.get("chunk_chars", 600)
+        self.retrieval_min_lore_tokens = retrieval.get("min_lore_tokens", 1500)
+        self.retrieval_world_tokens = retrieval.get("world_tokens", 1000)
+
+        memory = config.get("memory", {})
+        self.memory_batch_size = memory.get("batch_size", 0)
+        self.memory_max_tokens = memory.get("max_summary_tokens", 300)
+        self.memory_per_npc = memory.get("per_npc", False)
+
+        scheduler = config.get("scheduler", {})
+        self.ambient_jitter_seconds = scheduler.get("ambient_jitter_seconds", 0)
+        self.event_minute = scheduler.get("event_minute", 30)
+        self.misfire_grace_seconds = scheduler.get("misfire_grace_seconds", 600)
+
+        jobs = config.get("jobs", {})
+        self.job_workers = jobs.get("workers", 4)
+        self.job_timeout_seconds = jobs.get("timeout_seconds", 180)
+        self.job_max_ambient_depth = jobs.get("max_ambient_queue_depth", 2)
+
+        webserver = config["webserver"]
+        self.web_host = webserver["host"]
+        self.web_port = webserver["port"]
+        self.web_threads = webserver.get("threads", 4)
+        self.web_shutdown_timeout_seconds = webserver.get("shutdown_timeout_seconds", 5)
 
-WEB_HOST = CONFIG["webserver"]["host"]
-WEB_PORT = CONFIG["webserver"]["port"]
 
 class LevelFilter(logging.Filter):
     def __init__(self, level: int) -> None:
@@ -43,429 +150,845 @@ class LevelFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         return record.levelno == self.level
 
-formatter = logging.Formatter("%(asctime)s %(levelname)s:%(name)s:%(message)s")
-root_logger = logging.getLogger()
-root_logger.setLevel(LOG_LEVEL)
-
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-root_logger.addHandler(stream_handler)
-
-for name, level in [
-    ("debug", logging.DEBUG),
-    ("info", logging.INFO),
-    ("warning", logging.WARNING),
-    ("error", logging.ERROR),
-]:
-    file_handler = logging.FileHandler(os.path.join(LOG_DIR, f"{name}.log"))
-    file_handler.setLevel(level)
-    file_handler.addFilter(LevelFilter(level))
-    file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
-
-logger = logging.getLogger(__name__)
-
-load_dotenv()
-DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-CHANNEL_ID = os.getenv('CHANNEL_ID')
-PING_CHANNEL_ID = os.getenv('PING_CHANNEL_ID')
-WEB_USERNAME = os.getenv('WEB_USERNAME')
-WEB_PASSWORD = os.getenv('WEB_PASSWORD')
-FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'secret')
-
-logger.debug("Loaded environment variables: CHANNEL_ID=%s", CHANNEL_ID)
-
-if DISCORD_TOKEN is None:
-    raise RuntimeError('DISCORD_TOKEN environment variable is not set')
 
-if OPENAI_API_KEY is None:
-    raise RuntimeError('OPENAI_API_KEY environment variable is not set')
+_log_listener: logging.handlers.QueueListener | None = None
 
-if CHANNEL_ID is None:
-    raise RuntimeError('CHANNEL_ID environment variable is not set')
 
-if PING_CHANNEL_ID is None:
-    raise RuntimeError('PING_CHANNEL_ID environment variable is not set')
+def setup_logging(settings: Settings) -> None:
+    """Routes the root logger through a queue to the console and the log files.
 
-if WEB_USERNAME is None or WEB_PASSWORD is None:
-    raise RuntimeError('WEB_USERNAME or WEB_PASSWORD is not set')
-
-CHANNEL_ID = int(CHANNEL_ID)
-PING_CHANNEL_ID = int(PING_CHANNEL_ID)
-
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-logger.debug('OpenAI client initialized')
+    Logging is process-wide, so only the first call has an effect.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    os.makedirs(settings.log_dir, exist_ok=True)
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s:%(name)s:%(message)s")
+    root_logger = logging.getLogger()
+    root_logger.setLevel(settings.log_level)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    log_handlers = [stream_handler]
+
+    for name, level in [
+        ("debug", logging.DEBUG),
+        ("info", logging.INFO),
+        ("warning", logging.WARNING),
+        ("error", logging.ERROR),
+    ]:
+        file_handler = RotatingLogHandler(
+            os.path.join(settings.log_dir, f"{name}.log"), settings.log_max_bytes, settings.log_backup_count
+        )
+        file_handler.setLevel(level)
+        file_handler.addFilter(LevelFilter(level))
+        file_handler.setFormatter(formatter)
+        log_handlers.append(file_handler)
+
+    # Handlers run on the listener's thread; logging calls only enqueue.
+    queue_handler = LogQueueHandler(settings.log_queue_size)
+    root_logger.addHandler(queue_handler)
+    _log_listener = logging.handlers.QueueListener(queue_handler.queue, *log_handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+class BotApp:
+    """One bot instance: settings, clients, campaigns and event handlers.
+
+    Nothing is built in the constructor. The OpenAI and Discord clients, the
+    campaigns and the web panel are created on first access and the modules
+    they need are imported only then, so an app is cheap to construct and
+    several can live side by side, e.g. in benchmarks. ``env`` defaults to
+    the process environment after loading ``.env``; a missing variable is
+    reported when the component that needs it is first built.
+    """
+
+    def __init__(self, base_dir: str = BASE_DIR, config: dict | None = None, env=None) -> None:
+        self.base_dir = base_dir
+        self.config = config if config is not None else load_config(base_dir)
+        self.settings = Settings(self.config, base_dir)
+        if env is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            env = os.environ
+        self.env = env
+        self.tree = None
+        self.seeding: set[int] = set()
+
+    def require_env(self, name: str) -> str:
+        value = self.env.get(name)
+        if value is None:
+            raise RuntimeError(f'{name} environment variable is not set')
+        return value
+
+    @cached_property
+    def channel_id(self) -> int:
+        return int(self.require_env('CHANNEL_ID'))
+
+    @cached_property
+    def ping_channel_id(self) -> int:
+        return int(self.require_env('PING_CHANNEL_ID'))
+
+    @cached_property
+    def llm(self):
+        from openai import AsyncOpenAI
+        from llm_client import ResilientClient
+
+        s = self.settings
+        openai_client = AsyncOpenAI(api_key=self.require_env('OPENAI_API_KEY'), base_url=s.openai_base_url, max_retries=0)
+        llm = ResilientClient(
+            openai_client,
+            s.openai_model,
+            s.openai_max_tokens,
+            max_concurrent=s.openai_max_concurrent_requests,
+            max_retries=s.openai_max_retries,
+            requests_per_minute=s.openai_requests_per_minute,
+            tokens_per_minute=s.openai_tokens_per_minute,
+            breaker_threshold=s.openai_breaker_threshold,
+            breaker_cooldown=s.openai_breaker_cooldown,
+        )
+        logger.debug('OpenAI client initialized (max %d concurrent requests)', s.openai_max_concurrent_requests)
+        return llm
+
+    @cached_property
+    def response_cache(self) -> ResponseCache:
+        s = self.settings
+        return ResponseCache(s.response_cache_dir, s.response_cache_ttl_hours * 3600, s.response_cache_max_entries)
+
+    @cached_property
+    def client(self) -> discord.Client:
+        import discord
+        from discord import app_commands
+
+        intents = discord.Intents.default()
+        intents.message_content = True
+        if self.settings.discord_sharded:
+            client = discord.AutoShardedClient(intents=intents, shard_count=self.settings.discord_shard_count)
+        else:
+            client = discord.Client(intents=intents)
+        for handler in (
+            self.on_ready,
+            self.on_message,
+            self.on_raw_message_edit,
+            self.on_raw_message_delete,
+            self.on_raw_bulk_message_delete,
+        ):
+            client.event(handler)
+        self.tree = app_commands.CommandTree(client)
+        self.register_commands(self.tree)
+        logger.debug('Discord client initialized')
+        return client
+
+    @cached_property
+    def scheduler_state(self) -> SchedulerState:
+        return SchedulerState(self.settings.scheduler_state_path)
+
+    @cached_property
+    def campaign_paths(self) -> dict[int, tuple[str, str]]:
+        paths = {self.channel_id: (self.settings.prompt_data_path, self.settings.sqlite_path)}
+        for channel_id, data_path, sqlite_path in self.settings.campaigns:
+            paths[channel_id] = (data_path, sqlite_path)
+        return paths
+
+    @cached_property
+    def campaigns(self) -> CampaignRegistry:
+        campaigns = CampaignRegistry(
+            self.create_campaign, self.campaign_paths, self.channel_id, self.settings.campaign_idle_minutes * 60
+        )
+        atexit.register(campaigns.close)
+        return campaigns
+
+    @cached_property
+    def job_queue(self) -> JobQueue:
+        s = self.settings
+        return JobQueue(s.job_workers, s.job_timeout_seconds, s.job_max_ambient_depth)
+
+    @cached_property
+    def channel_buffer(self) -> ChannelBuffer:
+        s = self.settings
+        return ChannelBuffer(max(s.message_buffer_size, s.context_message_limit + 2 * s.memory_batch_size + 1))
+
+    @cached_property
+    def reply_coalescer(self) -> ReplyCoalescer:
+        s = self.settings
+        return ReplyCoalescer(self.enqueue_reply, s.reply_debounce_seconds, s.reply_max_wait_seconds)
+
+    @cached_property
+    def scheduler(self) -> Scheduler:
+        s = self.settings
+        scheduler = Scheduler()
+        scheduler.add("weather", self.weather_job, daily(s.daily_weather_hour))
+        scheduler.add(
+            "ambient", self.ambient_job, every_hours(s.task_interval_hours),
+            jitter=s.ambient_jitter_seconds, misfire_grace=s.misfire_grace_seconds,
+        )
+        scheduler.add(
+            "events", self.event_job, every_hours(s.task_interval_hours, s.event_minute),
+            misfire_grace=s.misfire_grace_seconds,
+        )
+        return scheduler
+
+    @cached_property
+    def web_app(self):
+        import web
+
+        username = self.env.get('WEB_USERNAME')
+        password = self.env.get('WEB_PASSWORD')
+        if username is None or password is None:
+            raise RuntimeError('WEB_USERNAME or WEB_PASSWORD is not set')
+        os.makedirs(self.settings.log_dir, exist_ok=True)
+        return web.create_web_app(
+            self.config,
+            lambda: self.campaigns.default.store,
+            self.apply_config,
+            self.settings.log_dir,
+            username,
+            password,
+            self.base_dir,
+            self.env.get('FLASK_SECRET_KEY', 'secret'),
+            logger,
+        )
 
-intents = discord.Intents.default()
-intents.message_content = True
-client = discord.Client(intents=intents)
-tree = app_commands.CommandTree(client)
-logger.debug('Discord client initialized')
+    @cached_property
+    def web_server(self):
+        from web_server import WebServer
+
+        s = self.settings
+        return WebServer(self.web_app, s.web_host, s.web_port, s.web_threads, s.web_shutdown_timeout_seconds)
+
+    def create_persistence(self, prompt_data_path: str, sqlite_path: str):
+        s = self.settings
+        if s.storage_backend == "sqlite":
+            persistence = SqlitePersistence(sqlite_path, prompt_data_path, s.save_debounce_seconds)
+        else:
+            persistence = JsonPersistence(prompt_data_path, s.save_debounce_seconds)
+        logger.debug("Using %s storage backend at %s", s.storage_backend, persistence.path)
+        return persistence
+
+    def save_scheduler_state(self, campaign: Campaign):
+        self.scheduler_state.update(campaign.channel_id, campaign.scheduler_state())
+
+    def create_campaign(self, channel_id: int) -> Campaign:
+        s = self.settings
+        campaign = Campaign(
+            channel_id,
+            self.create_persistence(*self.campaign_paths[channel_id]),
+            prompt_cache_size=s.prompt_cache_size,
+            prompt_token_budget=s.prompt_token_budget,
+            retrieval_top_k=s.retrieval_top_k,
+            retrieval_min_lore_tokens=s.retrieval_min_lore_tokens,
+            chunk_chars=s.retrieval_chunk_chars,
+            retrieval_world_tokens=s.retrieval_world_tokens,
+        )
+        campaign.memory = ConversationMemory(
+            lambda: campaign.store, self.llm.create, s.context_message_limit,
+            s.memory_batch_size, s.memory_max_tokens, s.memory_per_npc,
+        )
+        campaign.load()
+        campaign.restore_scheduler_state(self.scheduler_state.get(channel_id))
+        return campaign
+
+    def refresh_data(self):
+        for campaign in self.campaigns.loaded():
+            campaign.load()
+
+    def apply_config(self):
+        # Called by the web panel after it updated self.config in place.
+        # Values read per call (quiet hours, probabilities, model, ...) take
+        # effect now; components already built keep the settings they got.
+        try:
+            settings = Settings(self.config, self.base_dir)
+        except (KeyError, TypeError, ValueError):
+            logger.error("Invalid settings in config.json; keeping the previous ones", exc_info=True)
+        else:
+            self.settings = settings
+        self.refresh_data()
+
+    def get_random_npc(self, campaign: Campaign):
+        return random.choice(campaign.npc_list)
+
+    def find_npcs_in_text(self, campaign: Campaign, content: str) -> list[str]:
+        with NPC_MATCH_SECONDS.time(matched="no") as labels:
+            npcs = campaign.find_npcs(content)
+            if npcs:
+                labels["matched"] = "yes"
+        return npcs
+
+    def roll_weather(self, campaign: Campaign):
+        roll = random.randint(1, 20)
+        desc = campaign.store.weather_table.get(roll, "Unknown")
+        logger.info("Weather roll %s => %s (channel %s)", roll, desc, campaign.channel_id)
+        return desc
+
+    def active_player_names(self, campaign: Campaign) -> tuple[str, ...]:
+        if self.settings.prompt_token_budget <= 0:
+            return ()
+        names = set()
+        for m in self.channel_buffer.recent(campaign.channel_id, self.settings.context_message_limit):
+            character = campaign.store.get_character(m.author)
+            if character:
+                names.add(character.split()[0])
+        return tuple(sorted(names))
+
+    def install_signal_handlers(self):
+        # Turn SIGTERM (e.g. a container stop) into a normal client shutdown so
+        # the web server is stopped and pending saves are flushed.
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.ensure_future(self.client.close())
+            )
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def on_ready(self):
+        self.install_signal_handlers()
+        await self.tree.sync()
+        self.job_queue.start()
+        for channel_id in sorted(self.campaigns.channel_ids):
+            await self.seed_channel_buffer(channel_id)
+        self.refresh_data()
+        now = datetime.now()
+        for channel_id in sorted(self.campaigns.channel_ids):
+            self.run_daily_work(channel_id, now)
+        self.scheduler.start()
+        await self.process_update_file()
+        logger.info("Logged in as %s", self.client.user)
+
+    async def seed_channel_buffer(self, channel_id: int):
+        if self.channel_buffer.is_seeded(channel_id) or channel_id in self.seeding:
+            return
+        self.seeding.add(channel_id)
+        try:
+            channel = self.client.get_channel(channel_id)
+            messages = [BufferedMessage.from_message(m) async for m in channel.history(limit=self.channel_buffer.maxlen)]
+        except Exception:
+            logger.error('Error seeding message buffer for channel %s', channel_id, exc_info=True)
+            return
+        finally:
+            self.seeding.discard(channel_id)
+        self.channel_buffer.seed(channel_id, messages)
+        logger.debug('Seeded message buffer for channel %s with %d messages', channel_id, len(messages))
+
+    def schedule_memory_update(self, campaign: Campaign):
+        channel_id = campaign.channel_id
+        pending = campaign.memory.due(channel_id, self.channel_buffer.recent(channel_id, self.channel_buffer.maxlen))
+        if not pending:
+            return
+        running = campaign.memory.running
+        running.add(channel_id)
+        future = self.submit_for(
+            campaign, PRIORITY_AMBIENT, campaign.memory.update, channel_id, pending, campaign.find_npcs,
+            name="memory_update",
+        )
+        if future is None:
+            running.discard(channel_id)
+        else:
+            future.add_done_callback(lambda _: running.discard(channel_id))
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        content = payload.data.get("content")
+        if content is not None:
+            self.channel_buffer.edit(payload.channel_id, payload.message_id, content)
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.channel_buffer.delete(payload.channel_id, [payload.message_id])
+
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.channel_buffer.delete(payload.channel_id, payload.message_ids)
+
+    async def on_message(self, message: discord.Message):
+        campaign = self.campaigns.get(message.channel.id)
+        if campaign is not None:
+            self.channel_buffer.append(campaign.channel_id, BufferedMessage.from_message(message))
+            await self.seed_channel_buffer(campaign.channel_id)
+            self.schedule_memory_update(campaign)
+        if message.content.lower().startswith(">>"):
+            MESSAGES.inc(result="ooc")
+            return
+        if message.author == self.client.user:
+            MESSAGES.inc(result="own")
+            return
+        if message.author.bot:
+            MESSAGES.inc(result="bot")
+            return
+        if hasattr(message.author, "roles") and any(role.name == "Weltenschmied" for role in message.author.roles):
+            MESSAGES.inc(result="weltenschmied")
+            return
+        if campaign is None:
+            MESSAGES.inc(result="other_channel")
+            return
+        npcs_in_message = self.find_npcs_in_text(campaign, message.content)
+        if npcs_in_message:
+            MESSAGES.inc(result="triggered")
+            self.reply_coalescer.submit(npcs_in_message, message)
+        else:
+            MESSAGES.inc(result="no_npc")
+
+    def register_commands(self, tree):
+        import discord
+        from discord import app_commands
+
+        @tree.command(name="force", description="Sofort eine Nachricht posten")
+        async def force_command(interaction: discord.Interaction):
+            await interaction.response.defer(ephemeral=True)
+            campaign = self.campaigns.get(interaction.channel_id) or self.campaigns.default
+            npc = self.get_random_npc(campaign)
+            logger.info("Force command triggered by %s using NPC %s", interaction.user, npc)
+            await self.run_job(
+                PRIORITY_ADMIN, self.generate_and_send, campaign, f'Schreibe eine kurze Szene mit dem NPC {npc}.', npc,
+                campaign=campaign,
+            )
+            await interaction.followup.send("Nachricht gepostet.", ephemeral=True)
+
+        @tree.command(name="regie", description="Regieanweisungen geben")
+        @app_commands.describe(anweisung="Was soll geschehen?")
+        async def regie_command(interaction: discord.Interaction, anweisung: str):
+            if not any(role.name == "Weltenschmied" for role in getattr(interaction.user, "roles", [])):
+                await interaction.response.send_message(
+                    "Nur Weltenschmiede können diese Funktion nutzen.", ephemeral=True
+                )
+                return
+            await interaction.response.defer(ephemeral=True)
+            logger.info("Regie command triggered by %s: %s", interaction.user, anweisung)
+            campaign = self.campaigns.get(interaction.channel_id) or self.campaigns.default
+            npcs_in_text = self.find_npcs_in_text(campaign, anweisung)
+            if npcs_in_text:
+                await self.run_job(PRIORITY_ADMIN, self.generate_and_send, campaign, anweisung, npcs_in_text,
+                                   campaign=campaign)
+            else:
+                await self.run_job(PRIORITY_ADMIN, self.generate_and_send, campaign, anweisung, campaign=campaign)
+            await interaction.followup.send("Regieanweisung ausgeführt.", ephemeral=True)
+
+    def submit_for(self, campaign: Campaign, priority: int, func, *args, name: str | None = None):
+        # The campaign is not evicted while the job is queued or running.
+        future = self.job_queue.submit(priority, func, *args, name=name)
+        if future is not None:
+            campaign.jobs += 1
+
+            def done(_):
+                campaign.jobs -= 1
+
+            future.add_done_callback(done)
+        return future
+
+    async def run_job(self, priority: int, func, *args, campaign: Campaign | None = None):
+        if campaign is not None:
+            future = self.submit_for(campaign, priority, func, *args)
+        else:
+            future = self.job_queue.submit(priority, func, *args)
+        if future is None:
+            return None
+        try:
+            return await future
+        except Exception:
+            # Already logged by the worker that ran the job.
+            return None
+
+    async def create_response(self, system_prompt: str, user_prompt: str, cache_key: str | None = None) -> str:
+        return await self.llm.create(system_prompt, user_prompt, cache_key)
+
+    async def create_cached_response(self, cache_identity: str, system_prompt: str, user_prompt: str,
+                                     cache_key: str | None = None) -> str:
+        # cache_identity stands in for the system prompt in the cache key so
+        # callers can leave out volatile parts such as the current time.
+        key = self.response_cache.key(self.settings.openai_model, cache_identity, user_prompt)
+        message = self.response_cache.get(key)
+        if message is not None:
+            RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+            logger.info('Using cached response %s', key[:12])
+            return message
+        RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+        message = await self.create_response(system_prompt, user_prompt, cache_key)
+        if message:
+            self.response_cache.put(key, message)
+        return message
+
+    async def generate_and_send(self, campaign: Campaign, input, npc_names: list[str] | str | None = None,
+                                cacheable: bool = False, query: str | None = None):
+        with GENERATE_SECONDS.time(result="error") as labels:
+            message = await self._generate_and_send(campaign, input, npc_names, cacheable, query)
+            if message is not None:
+                labels["result"] = "none" if "[none]" in message else "sent"
+
+    async def _generate_and_send(self, campaign: Campaign, input, npc_names: list[str] | str | None,
+                                 cacheable: bool, query: str | None) -> str | None:
+        current_time = datetime.now().strftime('%H:%M')
+        if isinstance(npc_names, str):
+            npc_names = [npc_names]
+        static_prompt = campaign.static_prompt(tuple(sorted(set(npc_names or []))), self.active_player_names(campaign))
+        # The volatile part goes last so the static prefix stays byte-identical
+        # between calls and can be served from OpenAI's prompt cache.
+        parts = [static_prompt]
+        if campaign.use_retrieval():
+            lore = campaign.retrieve_lore(f"{query or input} {' '.join(npc_names or [])}", npc_names or ())
+            if lore:
+                parts.append(lore)
+        parts.append(f"Es ist aktuell {current_time} Uhr. Das Wetter heute: {campaign.current_weather}.")
+        prompt = "\n\n".join(parts)
+        cache_key = hashlib.sha256(static_prompt.encode("utf-8")).hexdigest()[:32]
+        logger.debug('Prompt sent to OpenAI: %s', prompt)
+        channel = self.client.get_channel(campaign.channel_id)
 
-def load_prompt_data(path=PROMPT_DATA_PATH):
-    logger.debug("Loading prompt data from %s", path)
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        try:
+            if self.settings.openai_streaming and not cacheable:
+                message = await self.stream_and_send(channel, prompt, input, cache_key)
+            else:
+                if cacheable:
+                    identity = "\n\n".join([*parts[:-1], f"{datetime.now().date()} {campaign.current_weather}"])
+                    message = await self.create_cached_response(identity, prompt, input, cache_key)
+                else:
+                    message = await self.create_response(prompt, input, cache_key)
+                if not ("[none]" or "none") in message:
+                    await channel.send(message)
+                    print(message)
+            logger.debug('OpenAI response: %s', message)
+            logger.info('Message sent to channel %s', channel.id)
+            return message
+        except Exception:
+            logger.error('Error while sending message', exc_info=True)
+            return None
+
+    async def stream_and_send(self, channel: discord.TextChannel, prompt: str, input: str, cache_key: str) -> str:
+        # Nothing is posted until stream_min_chars arrived, so a reply that is
+        # just the [none] sentinel never shows up in the channel. Edits are
+        # throttled to stay well inside Discord's rate limits.
+        s = self.settings
+        text = ""
+        posted = None
+        last_edit = 0.0
+        try:
+            async with aclosing(self.llm.stream(prompt, input, cache_key)) as deltas:
+                async for delta in deltas:
+                    text += delta
+                    if "[none]" in text:
+                        break
+                    visible = text.strip()
+                    if posted is None:
+                        if len(visible) >= s.stream_min_chars:
+                            posted = await channel.send(visible)
+                            last_edit = time.monotonic()
+                    elif time.monotonic() - last_edit >= s.stream_edit_interval_seconds:
+                        posted = await posted.edit(content=visible)
+                        last_edit = time.monotonic()
+        except Exception:
+            if posted is not None:
+                await posted.delete()
+            raise
+        message = text.strip()
+        if "[none]" in message:
+            if posted is not None:
+                await posted.delete()
+            return message
+        if posted is None:
+            if message:
+                await channel.send(message)
+        elif posted.content != message:
+            await posted.edit(content=message)
+        return message
+
+    async def get_recent_messages(self, campaign: Campaign, channel: discord.TextChannel, limit: int | None = None,
+                                  before: discord.Message | None = None, exclude: frozenset[int] = frozenset()):
+        if limit is None:
+            limit = self.settings.context_message_limit
+        if self.channel_buffer.is_seeded(channel.id):
+            with HISTORY_SECONDS.time(source="buffer"):
+                recent = self.channel_buffer.recent(channel.id, limit, before.id if before is not None else None)
+        else:
+            logger.debug('Message buffer for channel %s not seeded; fetching history', channel.id)
+            with HISTORY_SECONDS.time(source="discord"):
+                recent = [BufferedMessage.from_message(m) async for m in channel.history(limit=limit, before=before)]
+            recent.reverse()
+        lines = [f"{campaign.store.users[m.author]}: {m.content}" for m in recent if m.id not in exclude]
+        budget = self.settings.history_token_budget
+        if budget > 0:
+            # Keep the newest messages that fit; older ones are dropped first.
+            remaining = budget
+            kept = 0
+            for line in reversed(lines):
+                remaining -= count_tokens(line) + 1
+                if remaining < 0:
+                    break
+                kept += 1
+            if kept < len(lines):
+                logger.debug('History trimmed to %d of %d messages (%d token budget)', kept, len(lines), budget)
+            lines = lines[len(lines) - kept:]
+        return "\n".join(lines)
+
+    async def trigger_context(self, campaign: Campaign, channel: discord.TextChannel,
+                              trigger_messages: list[discord.Message]) -> str:
+        # Coalesced triggers can be far apart; what was said between them
+        # belongs in the context, the triggers themselves are quoted below it.
+        return await self.get_recent_messages(
+            campaign, channel, before=trigger_messages[-1], exclude=frozenset(m.id for m in trigger_messages)
+        )
 
-def save_prompt_data(data: dict, path=PROMPT_DATA_PATH):
-    logger.debug("Saving prompt data to %s", path)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def build_pre_prompt(data: dict) -> str:
-    def join_section(items, fmt):
-        return "\n".join(fmt(i) for i in items)
-
-    spieler_txt = join_section(
-        data.get("spieler", []), lambda p: f"{p['name']} – {p['info']}"
-    )
-    npc_txt = join_section(
-        data.get("npc", []), lambda n: f"{n['name']}: {n['short']}"
-    )
-    tiere_txt = join_section(
-        data.get("tiere", []), lambda t: f"{t['name']}: {t['info']}"
-    )
-    parts = [
-        data.get("core", ""),
-        "Spielercharaktere:\n" + spieler_txt,
-        "Nicht-Spielercharaktere:\n" + npc_txt,
-        "Tiere:\n" + tiere_txt,
-    ]
-    section_title = "Gegebene Weltinformationen (fest, nicht erweitern!):"
-    parts.append(section_title + "\n" + data.get("welt", ""))
-    return "\n\n".join(parts)
-
-NPC_LIST: list[str] = []
-WEATHER_TABLE: dict[int, str] = {}
-USER_LIST: dict[str, str] = {}
-
-def refresh_data():
-    global PROMPT_DATA, PRE_PROMPT, NPC_LIST, WEATHER_TABLE, USER_LIST
-    PROMPT_DATA = load_prompt_data()
-    PRE_PROMPT = build_pre_prompt(PROMPT_DATA)
-    NPC_LIST = sorted({n["name"].split()[0] for n in PROMPT_DATA.get("npc", [])})
-    WEATHER_TABLE = {int(k): v for k, v in PROMPT_DATA.get("weather_table", {}).items()}
-    USER_LIST = PROMPT_DATA.get("user_list", {})
-    logger.debug(
-        "Prompt data refreshed: %d NPCs, %d players, %d animals, %d users",
-        len(NPC_LIST),
-        len(PROMPT_DATA.get("spieler", [])),
-        len(PROMPT_DATA.get("tiere", [])),
-        len(USER_LIST),
-    )
-
-refresh_data()
-
-web.init_web(
-    CONFIG,
-    lambda: PROMPT_DATA,
-    save_prompt_data,
-    refresh_data,
-    LOG_DIR,
-    WEB_USERNAME,
-    WEB_PASSWORD,
-    BASE_DIR,
-    FLASK_SECRET_KEY,
-    logger,
-)
+    def format_trigger_messages(self, campaign: Campaign, trigger_messages: list[discord.Message]) -> str:
+        return "\n".join(
+            f"Nachricht von {campaign.store.users[str(m.author)]}: {m.content}" for m in trigger_messages
+        )
 
-current_weather = "Undetermined"
-weather_roll_date = None
-event_probability = 0.01
-
-def get_random_npc():
-    return random.choice(NPC_LIST)
-
-def _npc_mentioned(npc: str, content: str) -> bool:
-    pattern = re.compile(rf"\b{re.escape(npc)}\b", re.IGNORECASE)
-    for match in pattern.finditer(content):
-        start = match.start()
-        i = start - 1
-        while i >= 0 and content[i].isspace():
-            i -= 1
-        if i >= 0 and content[i] == "~":
-            continue
-        return True
-    return False
-
-
-def find_npcs_in_text(content: str) -> list[str]:
-    found = {npc for npc in NPC_LIST if _npc_mentioned(npc, content)}
-    return sorted(found)
-
-def roll_weather():
-    roll = random.randint(1, 20)
-    desc = WEATHER_TABLE.get(roll, "Unknown")
-    logger.info("Weather roll %s => %s", roll, desc)
-    return desc
-
-@client.event
-async def on_ready():
-    await tree.sync()
-    hourly_post.start()
-    refresh_data()
-    await process_update_file()
-    logger.info("Logged in as %s", client.user)
-
-@client.event
-async def on_message(message: discord.Message):
-    if message.content.lower().startswith(">>"):
-        return
-    if message.author == client.user:
-        return
-    if message.author.bot:
-        return
-    if hasattr(message.author, "roles") and any(role.name == "Weltenschmied" for role in message.author.roles):
-        return
-    if message.channel.id != CHANNEL_ID:
-        return
-    content_lower = message.content.lower()
-    npcs_in_message = find_npcs_in_text(message.content)
-    if len(npcs_in_message) == 1:
-        await reply_as_npc(npcs_in_message[0], message)
-    elif len(npcs_in_message) > 1:
-        await reply_as_npcs(npcs_in_message, message)
-
-@tree.command(name="force", description="Sofort eine Nachricht posten")
-async def force_command(interaction: discord.Interaction):
-    await interaction.response.defer(ephemeral=True)
-    npc = get_random_npc()
-    logger.info("Force command triggered by %s using NPC %s", interaction.user, npc)
-    await generate_and_send(f'Schreibe eine kurze Szene mit dem NPC {npc}.', npc)
-    await interaction.followup.send("Nachricht gepostet.", ephemeral=True)
-
-@tree.command(name="regie", description="Regieanweisungen geben")
-@app_commands.describe(anweisung="Was soll geschehen?")
-async def regie_command(interaction: discord.Interaction, anweisung: str):
-    if not any(role.name == "Weltenschmied" for role in getattr(interaction.user, "roles", [])):
-        await interaction.response.send_message(
-            "Nur Weltenschmiede können diese Funktion nutzen.", ephemeral=True
+    def trigger_query(self, trigger_messages: list[discord.Message]) -> str:
+        return " ".join(m.content for m in trigger_messages)
+
+    def memory_section(self, campaign: Campaign, npc_names: list[str]) -> str:
+        section = campaign.memory.prompt_section(campaign.channel_id, npc_names)
+        return f"{section}\n\n" if section else ""
+
+    async def reply_as_npc(self, campaign: Campaign, npc_name: str, trigger_messages: list[discord.Message]):
+        logger.info('Generating reply as %s', npc_name)
+        channel = self.client.get_channel(campaign.channel_id)
+        context = await self.trigger_context(campaign, channel, trigger_messages)
+        target = "folgende Nachricht" if len(trigger_messages) == 1 else "folgende Nachrichten gemeinsam"
+        input_text = (
+            f"{self.memory_section(campaign, [npc_name])}"
+            f"Kontext der letzten Nachrichten:\n{context}\n\n"
+            f"Antworte als {npc_name} auf {target}. Halte dich an die Stilrichtlinien.\n"
+            f"Wenn es keinen Sinn ergibt, dass {npc_name} darauf reagiert, antworte ausschließlich mit [none].\n"
+            f"{self.format_trigger_messages(campaign, trigger_messages)}"
         )
-        return
-    await interaction.response.defer(ephemeral=True)
-    logger.info("Regie command triggered by %s: %s", interaction.user, anweisung)
-    npcs_in_text = find_npcs_in_text(anweisung)
-    if npcs_in_text:
-        await generate_and_send(anweisung, npcs_in_text)
-    else:
-        await generate_and_send(anweisung)
-    await interaction.followup.send("Regieanweisung ausgeführt.", ephemeral=True)
-
-def load_npc_extension(npc_name: str) -> str:
-    base = npc_name.split()[0]
-    for npc in PROMPT_DATA.get("npc", []):
-        if npc["name"].split()[0] == base:
-            extra = npc.get("long", "")
-            if extra:
-                logger.debug("Found NPC extension for %s", npc_name)
-                return extra
-    logger.debug("No NPC extension found for %s", npc_name)
-    return ""
-
-async def generate_and_send(input, npc_names: list[str] | str | None = None):
-    current_time = datetime.now().strftime('%H:%M')
-    parts = [PRE_PROMPT]
-    if npc_names:
-        if isinstance(npc_names, str):
-            npc_names = [npc_names]
-        for npc_name in npc_names:
-            extra = load_npc_extension(npc_name)
-            if extra:
-                parts.append(extra)
-    parts.append(f"Es ist aktuell {current_time} Uhr. Das Wetter heute: {current_weather}.")
-    prompt = "\n\n".join(parts)
-    logger.debug('Prompt sent to OpenAI: %s', prompt)
-    channel = client.get_channel(CHANNEL_ID)
-
-    try:
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            input=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": input},
-            ],
-            reasoning={"effort": "low"},
-            max_output_tokens=OPENAI_MAX_TOKENS,
+        await self.generate_and_send(campaign, input_text, npc_name, query=self.trigger_query(trigger_messages))
+
+    async def reply_as_npcs(self, campaign: Campaign, npc_names: list[str], trigger_messages: list[discord.Message]):
+        logger.info('Generating reply as %s', ", ".join(npc_names))
+        channel = self.client.get_channel(campaign.channel_id)
+        context = await self.trigger_context(campaign, channel, trigger_messages)
+        names_line = ", ".join(npc_names)
+        target = "folgende Nachricht" if len(trigger_messages) == 1 else "folgende Nachrichten gemeinsam"
+        input_text = (
+            f"{self.memory_section(campaign, npc_names)}"
+            f"Kontext der letzten Nachrichten:\n{context}\n\n"
+            f"Antworte auf {target}. Übernehme dabei nacheinander die Rollen der folgenden Charaktere in einer einzigen Nachricht."
+            f" Beginne jede Antwort mit dem jeweiligen Namen:\n{names_line}\n"
+            f"Wenn es für einen der Charaktere keinen Sinn ergibt zu antworten, lass ihn aus.\n"
+            f"Sollte es bei garkeinen Charakter Sinn ergeben, antworte ausschließlich mit [none]."
+            f"{self.format_trigger_messages(campaign, trigger_messages)}"
         )
-        message = response.output_text.strip()
-        logger.debug('OpenAI response: %s', message)
-        if not ("[none]" or "none") in message:
-            await channel.send(message)
-            print(message)
-        logger.info('Message sent to channel %s', channel.id)
-    except Exception:
-        logger.error('Error while sending message', exc_info=True)
-
-async def get_recent_messages(channel: discord.TextChannel, limit: int = CONTEXT_MESSAGE_LIMIT, before: discord.Message | None = None):
-    messages = []
-    async for msg in channel.history(limit=limit, before=before, oldest_first=False):
-        messages.append(f"{USER_LIST[str(msg.author)]}: {msg.content}")
-    messages.reverse()
-    return "\n".join(messages)
-
-async def reply_as_npc(npc_name: str, trigger_message: discord.Message):
-    logger.info('Generating reply as %s', npc_name)
-    channel = client.get_channel(CHANNEL_ID)
-    context = await get_recent_messages(channel, limit=CONTEXT_MESSAGE_LIMIT, before=trigger_message)
-    input_text = (
-        f"Kontext der letzten Nachrichten:\n{context}\n\n"
-        f"Antworte als {npc_name} auf folgende Nachricht. Halte dich an die Stilrichtlinien.\n"
-        f"Wenn es keinen Sinn ergibt, dass {npc_name} darauf reagiert, antworte ausschließlich mit [none].\n"
-        f"Nachricht von {USER_LIST[str(trigger_message.author)]}: {trigger_message.content}"
-    )
-    await generate_and_send(input_text, npc_name)
-
-async def reply_as_npcs(npc_names: list[str], trigger_message: discord.Message):
-    logger.info('Generating reply as %s', ", ".join(npc_names))
-    channel = client.get_channel(CHANNEL_ID)
-    context = await get_recent_messages(channel, limit=CONTEXT_MESSAGE_LIMIT, before=trigger_message)
-    names_line = ", ".join(npc_names)
-    input_text = (
-        f"Kontext der letzten Nachrichten:\n{context}\n\n"
-        f"Antworte auf folgende Nachricht. Übernehme dabei nacheinander die Rollen der folgenden Charaktere in einer einzigen Nachricht."
-        f" Beginne jede Antwort mit dem jeweiligen Namen:\n{names_line}\n"
-        f"Wenn es für einen der Charaktere keinen Sinn ergibt zu antworten, lass ihn aus.\n"
-        f"Sollte es bei garkeinen Charakter Sinn ergeben, antworte ausschließlich mit [none]."
-        f"Nachricht von {USER_LIST[str(trigger_message.author)]}: {trigger_message.content}"
-    )
-    await generate_and_send(input_text, npc_names)
-
-@tasks.loop(hours=TASK_INTERVAL_HOURS)
-async def hourly_post():
-    logger.debug('Hourly post task triggered')
-    now = datetime.now()
-    global current_weather, weather_roll_date, event_probability
-
-    if now.hour == DAILY_WEATHER_HOUR and (weather_roll_date != now.date()):
-        current_weather = roll_weather()
-        weather_roll_date = now.date()
-        if CONFIG["discord"].get("daily_weather_description_enabled", True):
-            await generate_and_send('Beschreibe das aktuelle Wetter. Verwende dabei KEINE NPCs')
-        logger.info('Daily weather determined: %s (event chance %.0f%%)', current_weather, event_probability * 100)
-
-    if SILENT_HOURS_START <= now.hour <= SILENT_HOURS_END:
-        logger.debug('Quiet hour')
-        return
+        await self.generate_and_send(campaign, input_text, npc_names, query=self.trigger_query(trigger_messages))
 
-    if random.random() < event_probability:
-        data = load_prompt_data()
-        events = data.get("events", [])
-        if events:
-            event = random.choice(events)
-            await generate_and_send(event.get("info", ""), event.get("npc"))
-            events.remove(event)
-            save_prompt_data(data)
-            refresh_data()
-            event_probability = 0.01
-            logger.info('Special event executed for NPC %s. Event chance reset to 1%%', event.get('npc'))
+    async def reply_to_triggers(self, npc_names: list[str], trigger_messages: list[discord.Message]):
+        campaign = self.campaigns.get(trigger_messages[0].channel.id)
+        if campaign is None:
+            return
+        campaign.jobs += 1
+        try:
+            if len(npc_names) == 1:
+                await self.reply_as_npc(campaign, npc_names[0], trigger_messages)
+            else:
+                await self.reply_as_npcs(campaign, npc_names, trigger_messages)
+        finally:
+            campaign.jobs -= 1
+
+    async def enqueue_reply(self, npc_names: list[str], trigger_messages: list[discord.Message]):
+        await self.run_job(PRIORITY_REPLY, self.reply_to_triggers, npc_names, trigger_messages)
+
+    def daily_weather_slot(self, now: datetime):
+        # The date of the most recent daily weather hour, today's or yesterday's.
+        if now.hour >= self.settings.daily_weather_hour:
+            return now.date()
+        return now.date() - timedelta(days=1)
+
+    def run_daily_work(self, channel_id: int, now: datetime):
+        # Runs at most once per slot, also when the bot was down at the weather
+        # hour; the slot is saved before any follow-up work is queued. The check
+        # uses the persisted state so idle campaigns are only loaded to roll.
+        slot = self.daily_weather_slot(now)
+        rolled = self.scheduler_state.get(channel_id).get("weather_roll_date")
+        if rolled is not None and date.fromisoformat(rolled) >= slot:
+            return
+        campaign = self.campaigns.get(channel_id)
+        if now.hour != self.settings.daily_weather_hour:
+            logger.info('Catching up missed daily weather roll for %s in channel %s', slot, campaign.channel_id)
+        campaign.current_weather = self.roll_weather(campaign)
+        campaign.weather_roll_date = slot
+        self.save_scheduler_state(campaign)
+        if self.config["discord"].get("daily_weather_description_enabled", True):
+            self.submit_for(
+                campaign, PRIORITY_AMBIENT, self.generate_and_send, campaign,
+                'Beschreibe das aktuelle Wetter. Verwende dabei KEINE NPCs', None, True,
+            )
+        logger.info('Daily weather determined: %s (event chance %.0f%%)', campaign.current_weather, campaign.event_probability * 100)
+
+    def is_silent_hour(self, now: datetime) -> bool:
+        return self.settings.silent_hours_start <= now.hour <= self.settings.silent_hours_end
+
+    async def weather_job(self, now: datetime):
+        for channel_id in sorted(self.campaigns.channel_ids):
+            self.run_daily_work(channel_id, now)
+
+    async def event_job(self, now: datetime):
+        if self.is_silent_hour(now):
+            AMBIENT_DECISIONS.inc(job="event", decision="quiet_hours")
+            return
+        if self.llm.degraded:
+            AMBIENT_DECISIONS.inc(job="event", decision="degraded")
+            return
+        for channel_id in sorted(self.campaigns.channel_ids):
+            self.run_event(channel_id)
+
+    async def ambient_job(self, now: datetime):
+        channel_ids = sorted(self.campaigns.channel_ids)
+        for channel_id in channel_ids:
+            # Catches up if the bot was down during the weather run.
+            self.run_daily_work(channel_id, now)
+        if self.is_silent_hour(now):
+            AMBIENT_DECISIONS.inc(job="ambient", decision="quiet_hours")
+            logger.debug('Quiet hour')
+        elif self.llm.degraded:
+            AMBIENT_DECISIONS.inc(job="ambient", decision="degraded")
+            logger.info('OpenAI is degraded; skipping ambient post')
+        else:
+            for channel_id in channel_ids:
+                await self.ambient_post(channel_id)
+        self.campaigns.evict_idle()
+
+    def run_event(self, channel_id: int):
+        # The dice use the persisted chance; the campaign is only loaded on a hit.
+        if random.random() >= self.scheduler_state.get(channel_id).get("event_probability", 0.01):
+            AMBIENT_DECISIONS.inc(job="event", decision="dice")
+            return
+        campaign = self.campaigns.get(channel_id)
+        events = campaign.store.events
+        if not events:
+            AMBIENT_DECISIONS.inc(job="event", decision="no_events")
+            return
+        event = random.choice(events)
+        if self.submit_for(campaign, PRIORITY_AMBIENT, self.generate_and_send, campaign, event.info, event.npc) is None:
+            AMBIENT_DECISIONS.inc(job="event", decision="queue_full")
+            return
+        AMBIENT_DECISIONS.inc(job="event", decision="posted")
+        campaign.store.remove_event(event)
+        campaign.event_probability = 0.01
+        self.save_scheduler_state(campaign)
+        logger.info('Special event executed for NPC %s. Event chance reset to 1%%', event.npc)
+
+    async def ambient_post(self, channel_id: int):
+        if random.random() > self.settings.post_probability:
+            AMBIENT_DECISIONS.inc(job="ambient", decision="dice")
+            logger.debug('No post this hour')
             return
-    
-    if random.random() > POST_PROBABILITY:
-        logger.debug('No post this hour')
-        return
 
-    try:
-        last_message = None
-        channel = client.get_channel(CHANNEL_ID)
-        async for message in channel.history(limit=1):
-            last_message = message
-            break
+        # Without the history the silence check below cannot tell whether
+        # players just spoke, so do not post into an unknown channel.
+        await self.seed_channel_buffer(channel_id)
+        if not self.channel_buffer.is_seeded(channel_id):
+            AMBIENT_DECISIONS.inc(job="ambient", decision="no_history")
+            logger.info('No message history for channel %s; skipped ambient post', channel_id)
+            return
+
+        last_message = self.channel_buffer.last(channel_id)
         if last_message is not None:
-            age = discord.utils.utcnow() - last_message.created_at
-            if age.total_seconds() < MIN_SECONDS_SINCE_USER_POST:
+            age = datetime.now(timezone.utc) - last_message.created_at
+            if age.total_seconds() < self.settings.min_seconds_since_user_post:
+                AMBIENT_DECISIONS.inc(job="ambient", decision="recent_message")
                 logger.debug('Last message only %s seconds old; skipped', age.total_seconds())
                 return
-    except Exception:
-        logger.error('Error fetching channel history', exc_info=True)
-        return
 
-    npc = get_random_npc()
-    await generate_and_send(f'Schreibe eine kurze Szene mit dem NPC {npc}.', npc)
+        # Loaded only now, once the dice and the silence check allow a post.
+        campaign = self.campaigns.get(channel_id)
+        npc = self.get_random_npc(campaign)
+        prompt = f'Schreibe eine kurze Szene mit dem NPC {npc}.'
+        if self.submit_for(campaign, PRIORITY_AMBIENT, self.generate_and_send, campaign, prompt, npc) is None:
+            AMBIENT_DECISIONS.inc(job="ambient", decision="queue_full")
+            return
+        AMBIENT_DECISIONS.inc(job="ambient", decision="posted")
 
-async def process_update_file():
-    await client.wait_until_ready()
-    
-    if not os.path.isfile(UPDATE_FILE_PATH):
-        logger.debug("No update file found at startup")
-        return
+    async def process_update_file(self):
+        await self.client.wait_until_ready()
+        update_file_path = self.settings.update_file_path
 
-    logger.info("Processing update file at %s", UPDATE_FILE_PATH)
-    try:
-        with open(UPDATE_FILE_PATH, "r", encoding="utf-8") as update_file:
-            update_content = update_file.read().strip()
-    except OSError:
-        logger.error("Failed to read update file", exc_info=True)
-        return
+        if not os.path.isfile(update_file_path):
+            logger.debug("No update file found at startup")
+            return
 
-    if not update_content:
-        logger.warning("Update file was empty; deleting without posting")
+        logger.info("Processing update file at %s", update_file_path)
         try:
-            os.remove(UPDATE_FILE_PATH)
+            with open(update_file_path, "r", encoding="utf-8") as update_file:
+                update_content = update_file.read().strip()
         except OSError:
-            logger.error("Failed to delete empty update file", exc_info=True)
-        return
+            logger.error("Failed to read update file", exc_info=True)
+            return
 
-    system_prompt = (
-        f"{PRE_PROMPT}\n\n"
-        "Du bleibst dieselbe erzählerische Stimme und verfasst nun eine verständliche, "
-        "freundliche Update-News für den Discord-Server. Halte den Ton atmosphärisch, "
-        "bleib im Präsens und erzähle konsequent aus der Ich-Perspektive, als würdest du "
-        "selbst deine neuen Möglichkeiten vorstellen. Vermeide Listen und halte dich an "
-        "höchstens fünf Sätze."
-    )
-    user_prompt = (
-        "Fasse die folgenden Notizen zu einer kurzen Update-News zusammen. "
-        "Schreibe bei der begrüßung @everyone mit dazu. Formuliere sie "
-        "klar auf Deutsch, bewahre dabei den etablierten Stil, bleibe bei den gegebenen "
-        "Informationen und sprich in der Ich-Perspektive:\n"
-        f"{update_content}"
-    )
-
-    try:
-        response = openai_client.responses.create(
-            model=OPENAI_MODEL,
-            input=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            reasoning={"effort": "low"},
-            max_output_tokens=OPENAI_MAX_TOKENS,
+        if not update_content:
+            logger.warning("Update file was empty; deleting without posting")
+            try:
+                os.remove(update_file_path)
+            except OSError:
+                logger.error("Failed to delete empty update file", exc_info=True)
+            return
+
+        system_prompt = (
+            f"{self.campaigns.default.pre_prompt}\n\n"
+            "Du bleibst dieselbe erzählerische Stimme und verfasst nun eine verständliche, "
+            "freundliche Update-News für den Discord-Server. Halte den Ton atmosphärisch, "
+            "bleib im Präsens und erzähle konsequent aus der Ich-Perspektive, als würdest du "
+            "selbst deine neuen Möglichkeiten vorstellen. Vermeide Listen und halte dich an "
+            "höchstens fünf Sätze."
+        )
+        user_prompt = (
+            "Fasse die folgenden Notizen zu einer kurzen Update-News zusammen. "
+            "Schreibe bei der begrüßung @everyone mit dazu. Formuliere sie "
+            "klar auf Deutsch, bewahre dabei den etablierten Stil, bleibe bei den gegebenen "
+            "Informationen und sprich in der Ich-Perspektive:\n"
+            f"{update_content}"
         )
-        update_message = response.output_text.strip()
-    except Exception:
-        logger.error("Failed to generate update news", exc_info=True)
-        return
 
-    if not update_message:
-        logger.warning("Generated update news was empty; keeping update file for manual review")
-        return
+        try:
+            update_message = await self.job_queue.submit(
+                PRIORITY_ADMIN, self.create_cached_response, system_prompt, system_prompt, user_prompt
+            )
+        except Exception:
+            logger.error("Failed to generate update news", exc_info=True)
+            return
+
+        if not update_message:
+            logger.warning("Generated update news was empty; keeping update file for manual review")
+            return
+
+        ping_channel_id = self.ping_channel_id
+        channel = self.client.get_channel(ping_channel_id)
+        if channel is None:
+            try:
+                channel = await self.client.fetch_channel(ping_channel_id)
+            except Exception:
+                logger.error("Could not resolve channel %s to post update", ping_channel_id, exc_info=True)
+                return
 
-    channel = client.get_channel(PING_CHANNEL_ID)
-    if channel is None:
         try:
-            channel = await client.fetch_channel(PING_CHANNEL_ID)
+            await channel.send(update_message)
+            logger.info("Posted update news to channel %s", ping_channel_id)
         except Exception:
-            logger.error("Could not resolve channel %s to post update", PING_CHANNEL_ID, exc_info=True)
+            logger.error("Failed to send update news to channel", exc_info=True)
             return
 
-    try:
-        await channel.send(update_message)
-        logger.info("Posted update news to channel %s", PING_CHANNEL_ID)
-    except Exception:
-        logger.error("Failed to send update news to channel", exc_info=True)
-        return
+        try:
+            os.remove(update_file_path)
+            logger.info("Deleted update file after posting news")
+        except OSError:
+            logger.error("Failed to delete update file after posting", exc_info=True)
+
+    def run(self) -> None:
+        setup_logging(self.settings)
+        logger.debug("Loaded environment variables: CHANNEL_ID=%s", self.env.get('CHANNEL_ID'))
+        for name in ('DISCORD_TOKEN', 'OPENAI_API_KEY', 'CHANNEL_ID', 'PING_CHANNEL_ID'):
+            self.require_env(name)
+        # The default campaign is loaded eagerly; the web panel edits it.
+        self.campaigns.default
+        self.web_server.start()
+        logger.info('Starting Discord bot')
+        try:
+            self.client.run(self.env['DISCORD_TOKEN'])
+        finally:
+            self.web_server.stop()
+            self.campaigns.close()
+
 
-    try:
-        os.remove(UPDATE_FILE_PATH)
-        logger.info("Deleted update file after posting news")
-    except OSError:
-        logger.error("Failed to delete update file after posting", exc_info=True)
+def create_app(base_dir: str = BASE_DIR, config: dict | None = None, env=None) -> BotApp:
+    return BotApp(base_dir, config, env)
 
-def run_flask():
-    web.app.run(host=WEB_HOST, port=WEB_PORT)
 
 if __name__ == '__main__':
-    Thread(target=run_flask, daemon=True).start()
-    logger.info('Starting Discord bot')
-    client.run(DISCORD_TOKEN)
+    create_app().run()
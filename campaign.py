@@ -0,0 +1,306 @@
+import time
+import logging
+from datetime import date
+from functools import lru_cache
+
+from npc_matcher import NpcMatcher
+from prompt_store import PromptStore
+from lore_index import LoreIndex, split_leading
+from token_budget import count_tokens, select_within_budget
+
+logger = logging.getLogger(__name__)
+
+PRE_PROMPT_SECTIONS = ("core", "spieler", "npc", "tiere", "welt")
+PRE_PROMPT_DEPENDENCIES = {
+    "core": "core",
+    "spieler": "spieler",
+    "npc": "npc",
+    "npc_short": "npc",
+    "tiere": "tiere",
+    "welt": "welt",
+}
+WORLD_TITLE = "Gegebene Weltinformationen (fest, nicht erweitern!):"
+LORE_TITLE = "Weitere passende Weltinformationen (fest, nicht erweitern!):"
+
+
+def build_pre_prompt_section(store: PromptStore, section: str) -> str:
+    def join_section(items, fmt):
+        return "\n".join(fmt(i) for i in items)
+
+    if section == "core":
+        return store.core
+    if section == "spieler":
+        return "Spielercharaktere:\n" + join_section(
+            store.players.values(), lambda p: f"{p.name} – {p.info}"
+        )
+    if section == "npc":
+        return "Nicht-Spielercharaktere:\n" + join_section(
+            store.npcs.values(), lambda n: f"{n.name}: {n.short}"
+        )
+    if section == "tiere":
+        return "Tiere:\n" + join_section(
+            store.animals.values(), lambda t: f"{t.name}: {t.info}"
+        )
+    return WORLD_TITLE + "\n" + store.welt
+
+
+class Campaign:
+    """One campaign channel with its prompt data and derived state.
+
+    Besides the ``PromptStore`` loaded from ``persistence`` a campaign keeps
+    everything built from it: the pre-prompt sections, the NPC matcher, the
+    lore index and a cache of assembled system prompts. Store listeners
+    rebuild only what a change affects. They run with ``store.lock`` held
+    on the thread that made the change, which for the web panel is not the
+    event loop, so ``static_prompt`` and ``retrieve_lore`` hold the lock as
+    well and never read a half-applied change. The scheduler state (weather
+    and event chance) lives here as well so every campaign rolls its own.
+    """
+
+    def __init__(self, channel_id: int, persistence, prompt_cache_size: int = 64, prompt_token_budget: int = 0,
+                 retrieval_top_k: int = 0, retrieval_min_lore_tokens: int = 1500, chunk_chars: int = 600,
+                 retrieval_world_tokens: int = 1000) -> None:
+        self.channel_id = channel_id
+        self.persistence = persistence
+        self.prompt_token_budget = prompt_token_budget
+        self.retrieval_top_k = retrieval_top_k
+        self.retrieval_min_lore_tokens = retrieval_min_lore_tokens
+        self.retrieval_world_tokens = retrieval_world_tokens
+        # The part of the world text that stays in the prompt with retrieval on.
+        self.fixed_world = ""
+        self.store = PromptStore()
+        self.pre_prompt_parts: dict[str, str] = {}
+        self.pre_prompt = ""
+        self.npc_list: list[str] = []
+        self.npc_matcher = NpcMatcher([])
+        self.lore_index = LoreIndex(chunk_chars)
+        self.memory = None
+        self._static_prompt = lru_cache(maxsize=prompt_cache_size)(self._build_static_prompt)
+        self.current_weather = "Undetermined"
+        self.weather_roll_date = None
+        self.event_probability = 0.01
+        self.last_used = time.monotonic()
+        self.jobs = 0
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def load(self) -> None:
+        self.persistence.flush()
+        logger.debug("Loading prompt data from %s", self.persistence.path)
+        store = PromptStore.from_dict(self.persistence.load())
+        store.add_listener(self.apply_changes)
+        store.add_listener(self.persist_changes)
+        # Readers may hold either lock, depending on when they looked up the store.
+        with self.store.lock, store.lock:
+            self.store = store
+            self.apply_changes(set(PRE_PROMPT_DEPENDENCIES))
+        logger.debug(
+            "Prompt data for channel %s refreshed: %d NPCs, %d players, %d animals, %d users",
+            self.channel_id,
+            len(self.npc_list),
+            len(self.store.players),
+            len(self.store.animals),
+            len(self.store.users),
+        )
+
+    def close(self) -> None:
+        self.persistence.flush()
+
+    def persist_changes(self, changed: set[str]) -> None:
+        self.persistence.schedule_save(self.store.to_dict)
+
+    def apply_changes(self, changed: set[str]) -> None:
+        sections = {PRE_PROMPT_DEPENDENCIES[c] for c in changed if c in PRE_PROMPT_DEPENDENCIES}
+        for section in sections:
+            self.pre_prompt_parts[section] = build_pre_prompt_section(self.store, section)
+        if sections:
+            self.pre_prompt = "\n\n".join(self.pre_prompt_parts[s] for s in PRE_PROMPT_SECTIONS)
+        if sections or "npc_long" in changed:
+            self._static_prompt.cache_clear()
+        if "npc" in changed:
+            self.npc_list = self.store.npc_names()
+            self.npc_matcher = NpcMatcher(self.npc_list)
+        self._sync_lore_index(changed)
+        logger.debug("Prompt data updated in memory: %s (rebuilt %s)", sorted(changed), sorted(sections))
+
+    def scheduler_state(self) -> dict:
+        return {
+            "current_weather": self.current_weather,
+            "weather_roll_date": self.weather_roll_date.isoformat() if self.weather_roll_date else None,
+            "event_probability": self.event_probability,
+        }
+
+    def restore_scheduler_state(self, state: dict) -> None:
+        self.current_weather = state.get("current_weather", self.current_weather)
+        roll_date = state.get("weather_roll_date")
+        self.weather_roll_date = date.fromisoformat(roll_date) if roll_date else None
+        self.event_probability = state.get("event_probability", self.event_probability)
+
+    def static_prompt(self, npc_names: tuple[str, ...], active_players: tuple[str, ...] = ()) -> str:
+        with self.store.lock:
+            return self._static_prompt(npc_names, active_players)
+
+    def find_npcs(self, content: str) -> list[str]:
+        return self.npc_matcher.find(content)
+
+    def npc_extension(self, npc_name: str) -> str:
+        npc = self.store.get_npc(npc_name)
+        if npc is not None and npc.long:
+            logger.debug("Found NPC extension for %s", npc_name)
+            return npc.long
+        logger.debug("No NPC extension found for %s", npc_name)
+        return ""
+
+    def _sync_lore_index(self, changed: set[str]) -> None:
+        if self.retrieval_top_k <= 0:
+            return
+        if "welt" in changed:
+            self.fixed_world, overflow = split_leading(self.store.welt, self.retrieval_world_tokens)
+            self.lore_index.set_source("welt", "Welt", overflow)
+        if changed & {"npc", "npc_long"}:
+            sources = {f"npc:{npc.key}": npc for npc in self.store.npcs.values()}
+            for source in self.lore_index.source_names() - sources.keys() - {"welt"}:
+                self.lore_index.remove_source(source)
+            for source, npc in sources.items():
+                self.lore_index.set_source(source, npc.name, npc.long)
+
+    def use_retrieval(self) -> bool:
+        # Small worlds still go into the prompt whole; retrieval only pays off
+        # once the lore is larger than what a single request should carry.
+        # The index holds the descriptions of all NPCs and the world text
+        # beyond retrieval_world_tokens; the start of the world text and the
+        # mentioned NPCs' descriptions are always part of the static prompt.
+        return self.retrieval_top_k > 0 and self.lore_index.total_tokens > self.retrieval_min_lore_tokens
+
+    def retrieve_lore(self, query: str, npc_names=()) -> str:
+        # Mentioned NPCs are already described in full in the static prompt.
+        exclude = frozenset(f"npc:{npc.key}" for npc in map(self.store.get_npc, npc_names) if npc is not None)
+        with self.store.lock:
+            results = self.lore_index.search(query, self.retrieval_top_k, exclude)
+        logger.debug(
+            "Retrieved %d lore chunks (%s)",
+            len(results),
+            ", ".join(f"{chunk.title} {score:.2f}" for score, chunk in results),
+        )
+        if not results:
+            return ""
+        return LORE_TITLE + "\n" + "\n\n".join(f"{chunk.title}: {chunk.text}" for _, chunk in results)
+
+    def world_text(self) -> str:
+        return self.fixed_world if self.use_retrieval() else self.store.welt
+
+    def _build_static_prompt(self, npc_names: tuple[str, ...], active_players: tuple[str, ...] = ()) -> str:
+        if self.prompt_token_budget > 0:
+            return self._build_budgeted_prompt(npc_names, active_players)
+        if self.use_retrieval():
+            # The rest of the world text is retrieved per request instead.
+            sections = {**self.pre_prompt_parts, "welt": WORLD_TITLE + "\n" + self.fixed_world}
+            parts = ["\n\n".join(sections[s] for s in PRE_PROMPT_SECTIONS)]
+        else:
+            parts = [self.pre_prompt]
+        for npc_name in npc_names:
+            extra = self.npc_extension(npc_name)
+            if extra:
+                parts.append(extra)
+        return "\n\n".join(parts)
+
+    def _build_budgeted_prompt(self, npc_names: tuple[str, ...], active_players: tuple[str, ...]) -> str:
+        # Candidates are offered in priority order: mentioned NPCs and their
+        # extensions, players active in the channel, the world text, and then
+        # everyone else. The chosen entries are rendered in the usual layout.
+        store = self.store
+        budget = self.prompt_token_budget
+        mentioned = [npc for npc in (store.get_npc(n) for n in npc_names) if npc is not None]
+        mentioned_keys = {npc.key for npc in mentioned}
+        active = [p for p in store.players.values() if p.name.split()[0] in active_players]
+        world = self.world_text()
+        candidates = [("npc", npc.key, f"{npc.name}: {npc.short}") for npc in mentioned]
+        candidates += [("npc_long", npc.key, npc.long) for npc in mentioned if npc.long]
+        candidates += [("spieler", p.name, f"{p.name} – {p.info}") for p in active]
+        candidates.append(("welt", "welt", world))
+        candidates += [("npc", n.key, f"{n.name}: {n.short}") for n in store.npcs.values() if n.key not in mentioned_keys]
+        candidates += [("spieler", p.name, f"{p.name} – {p.info}") for p in store.players.values() if p not in active]
+        candidates += [("tiere", t.name, f"{t.name}: {t.info}") for t in store.animals.values()]
+
+        core_tokens = count_tokens(store.core)
+        header_tokens = count_tokens("\n\n".join(build_pre_prompt_section(PromptStore(), s) for s in PRE_PROMPT_SECTIONS))
+        chosen, used = select_within_budget(candidates, budget - core_tokens - header_tokens)
+        spieler_txt = "\n".join(f"{p.name} – {p.info}" for p in store.players.values() if ("spieler", p.name) in chosen)
+        npc_txt = "\n".join(f"{n.name}: {n.short}" for n in store.npcs.values() if ("npc", n.key) in chosen)
+        tiere_txt = "\n".join(f"{t.name}: {t.info}" for t in store.animals.values() if ("tiere", t.name) in chosen)
+        parts = [
+            store.core,
+            "Spielercharaktere:\n" + spieler_txt,
+            "Nicht-Spielercharaktere:\n" + npc_txt,
+            "Tiere:\n" + tiere_txt,
+        ]
+        if ("welt", "welt") in chosen:
+            parts.append(WORLD_TITLE + "\n" + world)
+        parts += [npc.long for npc in mentioned if ("npc_long", npc.key) in chosen]
+
+        logger.debug(
+            "Prompt token budget %d: core=%d %s (%d entries left out)",
+            budget,
+            core_tokens,
+            " ".join(f"{section}={tokens}" for section, tokens in sorted(used.items())),
+            len(candidates) - len(chosen),
+        )
+        if core_tokens > budget:
+            logger.warning("Core prompt alone uses %d tokens, above the budget of %d", core_tokens, budget)
+        return "\n\n".join(parts)
+
+
+class CampaignRegistry:
+    """Loads campaigns on first use and evicts them again when idle.
+
+    ``factory(channel_id)`` builds and loads a campaign for one of the
+    configured ``channel_ids``. Campaigns not used for ``idle_seconds`` are
+    flushed and dropped by ``evict_idle``; the ``default_channel_id`` one
+    is kept loaded since the web panel edits it, and so is any campaign
+    with queued or running ``jobs``: those jobs hold the instance, and a
+    reloaded copy would otherwise have its data overwritten by their saves.
+    """
+
+    def __init__(self, factory, channel_ids, default_channel_id: int, idle_seconds: float) -> None:
+        self.factory = factory
+        self.channel_ids = set(channel_ids) | {default_channel_id}
+        self.default_channel_id = default_channel_id
+        self.idle_seconds = idle_seconds
+        self.campaigns: dict[int, Campaign] = {}
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.channel_ids
+
+    @property
+    def default(self) -> Campaign:
+        return self.get(self.default_channel_id)
+
+    def get(self, channel_id: int) -> Campaign | None:
+        if channel_id not in self.channel_ids:
+            return None
+        campaign = self.campaigns.get(channel_id)
+        if campaign is None:
+            campaign = self.campaigns[channel_id] = self.factory(channel_id)
+            logger.info("Loaded campaign for channel %s", channel_id)
+        campaign.touch()
+        return campaign
+
+    def loaded(self) -> list[Campaign]:
+        return list(self.campaigns.values())
+
+    def evict_idle(self) -> None:
+        if self.idle_seconds <= 0:
+            return
+        now = time.monotonic()
+        for channel_id, campaign in list(self.campaigns.items()):
+            if channel_id == self.default_channel_id or campaign.jobs:
+                continue
+            if now - campaign.last_used > self.idle_seconds:
+                campaign.close()
+                del self.campaigns[channel_id]
+                logger.info("Evicted idle campaign for channel %s", channel_id)
+
+    def close(self) -> None:
+        for campaign in self.campaigns.values():
+            campaign.close()
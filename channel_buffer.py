@@ -0,0 +1,82 @@
+from collections import deque
+from datetime import datetime
+
+
+class BufferedMessage:
+    __slots__ = ("id", "author", "content", "created_at")
+
+    def __init__(self, id: int, author: str, content: str, created_at: datetime) -> None:
+        self.id = id
+        self.author = author
+        self.content = content
+        self.created_at = created_at
+
+    @classmethod
+    def from_message(cls, message) -> "BufferedMessage":
+        return cls(message.id, str(message.author), message.content, message.created_at)
+
+
+class ChannelBuffer:
+    """Keeps the most recent messages of each channel in memory.
+
+    Messages are kept in id (and therefore chronological) order so context
+    for a reply and the age of the last post can be answered without
+    fetching the channel history from Discord.
+    """
+
+    def __init__(self, maxlen: int) -> None:
+        self.maxlen = maxlen
+        self.channels: dict[int, deque[BufferedMessage]] = {}
+        self.seeded: set[int] = set()
+
+    def _buffer(self, channel_id: int) -> deque[BufferedMessage]:
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            buffer = self.channels[channel_id] = deque(maxlen=self.maxlen)
+        return buffer
+
+    def seed(self, channel_id: int, messages) -> None:
+        merged = {m.id: m for m in messages}
+        for m in self._buffer(channel_id):
+            merged[m.id] = m
+        ordered = sorted(merged.values(), key=lambda m: m.id)
+        self.channels[channel_id] = deque(ordered, maxlen=self.maxlen)
+        self.seeded.add(channel_id)
+
+    def is_seeded(self, channel_id: int) -> bool:
+        return channel_id in self.seeded
+
+    def append(self, channel_id: int, message: BufferedMessage) -> None:
+        buffer = self._buffer(channel_id)
+        if buffer and buffer[-1].id > message.id:
+            ordered = sorted([*buffer, message], key=lambda m: m.id)
+            self.channels[channel_id] = deque(ordered, maxlen=self.maxlen)
+        else:
+            buffer.append(message)
+
+    def edit(self, channel_id: int, message_id: int, content: str) -> None:
+        for m in self.channels.get(channel_id, ()):
+            if m.id == message_id:
+                m.content = content
+                return
+
+    def delete(self, channel_id: int, message_ids) -> None:
+        buffer = self.channels.get(channel_id)
+        if not buffer:
+            return
+        ids = set(message_ids)
+        remaining = [m for m in buffer if m.id not in ids]
+        if len(remaining) != len(buffer):
+            self.channels[channel_id] = deque(remaining, maxlen=self.maxlen)
+
+    def recent(self, channel_id: int, limit: int, before_id: int | None = None) -> list[BufferedMessage]:
+        buffer = self.channels.get(channel_id, ())
+        if before_id is None:
+            messages = list(buffer)
+        else:
+            messages = [m for m in buffer if m.id < before_id]
+        return messages[-limit:] if limit > 0 else []
+
+    def last(self, channel_id: int) -> BufferedMessage | None:
+        buffer = self.channels.get(channel_id)
+        return buffer[-1] if buffer else None
@@ -0,0 +1,105 @@
+import logging
+
+from token_budget import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_INSTRUCTIONS = (
+    "Du führst das Gedächtnis einer laufenden Rollenspielrunde. Ergänze die bisherige "
+    "Zusammenfassung um die neuen Nachrichten. Behalte Ereignisse, Absprachen, Orte und "
+    "Beziehungen, lass Smalltalk weg und schreibe knapp im Präteritum. Antworte nur mit "
+    "der neuen Zusammenfassung in höchstens {words} Wörtern."
+)
+NPC_INSTRUCTIONS = (
+    "Du führst das Gedächtnis des Charakters {npc} in einer laufenden Rollenspielrunde. "
+    "Ergänze seine bisherigen Erinnerungen um das, was {npc} in den neuen Nachrichten "
+    "erlebt oder über andere erfahren hat. Antworte nur mit den neuen Erinnerungen in "
+    "höchstens {words} Wörtern."
+)
+
+
+class ConversationMemory:
+    """Rolling summary of the channel history that left the reply context.
+
+    Once ``batch_size`` messages have scrolled past the newest ``window``
+    messages, they are folded into the stored summary with one call to
+    ``summarize(system_prompt, user_prompt)``; the summary is never rebuilt
+    from scratch. With ``per_npc`` every NPC mentioned in the batch also
+    gets its own memory. Summaries live in the campaign data of the store
+    returned by ``get_store`` and are cut to ``max_tokens`` when injected
+    into a prompt. A ``batch_size`` of 0 disables the memory.
+
+    Whoever queues ``update`` adds the channel to ``running`` first and
+    removes it once the job is done or was not queued, so the same batch
+    is not queued again while the first job still waits for a worker.
+    """
+
+    def __init__(self, get_store, summarize, window: int, batch_size: int, max_tokens: int,
+                 per_npc: bool = False) -> None:
+        self.get_store = get_store
+        self.summarize = summarize
+        self.window = window
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.per_npc = per_npc
+        self.running: set[int] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.batch_size > 0
+
+    def due(self, channel_id: int, messages: list) -> list:
+        """Returns the messages to fold in, or nothing if the batch is not full yet."""
+        if not self.enabled or channel_id in self.running:
+            return []
+        last_id = self.get_store().get_memory(channel_id).get("last_message_id", 0)
+        older = messages[:-self.window] if self.window > 0 else messages
+        pending = [m for m in older if m.id > last_id]
+        return pending if len(pending) >= self.batch_size else []
+
+    async def update(self, channel_id: int, messages: list, find_npcs) -> None:
+        store = self.get_store()
+        memory = store.get_memory(channel_id)
+        transcript = "\n".join(f"{store.users.get(m.author, m.author)}: {m.content}" for m in messages)
+        words = self.max_tokens // 2
+        summary = await self._fold(
+            CHANNEL_INSTRUCTIONS.format(words=words), memory.get("summary", ""), transcript
+        )
+        npc_memories = {}
+        if self.per_npc:
+            for name in find_npcs(transcript):
+                npc = store.get_npc(name)
+                if npc is None:
+                    continue
+                npc_memories[npc.key] = await self._fold(
+                    NPC_INSTRUCTIONS.format(npc=npc.name, words=words // 2),
+                    memory.get("npc", {}).get(npc.key, ""),
+                    transcript,
+                )
+        self.get_store().update_memory(channel_id, summary, messages[-1].id, npc_memories)
+        logger.info(
+            "Folded %d messages into memory of channel %s (%d tokens, %d NPC memories)",
+            len(messages), channel_id, count_tokens(summary), len(npc_memories),
+        )
+
+    async def _fold(self, instructions: str, previous: str, transcript: str) -> str:
+        user_prompt = (
+            f"Bisherige Zusammenfassung:\n{previous or '(noch leer)'}\n\n"
+            f"Neue Nachrichten:\n{transcript}"
+        )
+        return (await self.summarize(instructions, user_prompt)).strip()
+
+    def prompt_section(self, channel_id: int, npc_names: list[str]) -> str:
+        if not self.enabled:
+            return ""
+        store = self.get_store()
+        memory = store.get_memory(channel_id)
+        parts = []
+        if memory.get("summary"):
+            parts.append("Bisheriges Geschehen:\n" + truncate_to_tokens(memory["summary"], self.max_tokens))
+        for name in npc_names:
+            npc = store.get_npc(name)
+            text = memory.get("npc", {}).get(npc.key) if npc is not None else None
+            if text:
+                parts.append(f"Erinnerungen von {npc.name}:\n" + truncate_to_tokens(text, self.max_tokens // 2))
+        return "\n\n".join(parts)
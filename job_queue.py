@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ADMIN = 0
+PRIORITY_REPLY = 1
+PRIORITY_AMBIENT = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_REPLY: "reply",
+    PRIORITY_AMBIENT: "ambient",
+}
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Fire-and-forget jobs already logged their failure in the worker.
+    if not future.cancelled():
+        future.exception()
+
+
+class _Job:
+    __slots__ = ("func", "args", "future", "name")
+
+    def __init__(self, func, args, future, name) -> None:
+        self.func = func
+        self.args = args
+        self.future = future
+        self.name = name
+
+
+class JobQueue:
+    """Priority queue with a bounded worker pool for generation jobs.
+
+    Jobs run in priority order (admin before replies before ambient posts)
+    and FIFO within one priority. Each job is cancelled after ``timeout``
+    seconds. Ambient jobs are dropped instead of queued while
+    ``max_ambient_depth`` or more jobs are already waiting.
+    """
+
+    def __init__(self, workers: int, timeout: float, max_ambient_depth: int) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self.max_ambient_depth = max_ambient_depth
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self.tasks:
+            return
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.debug("Started %d job workers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, priority: int, func, *args, name: str | None = None) -> asyncio.Future | None:
+        name = name or getattr(func, "__name__", "job")
+        depth = self.queue.qsize()
+        if priority >= PRIORITY_AMBIENT and depth >= self.max_ambient_depth:
+            logger.info("Dropped %s job %s: %d jobs already queued", PRIORITY_NAMES.get(priority), name, depth)
+            return None
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        self.queue.put_nowait((priority, next(self.counter), _Job(func, args, future, name)))
+        logger.debug("Queued %s job %s (queue depth %d)", PRIORITY_NAMES.get(priority), name, depth + 1)
+        return future
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            # wait_for can swallow a cancel that arrives as the job finishes;
+            # honour it here so stop() does not wait forever.
+            if asyncio.current_task().cancelling():
+                raise asyncio.CancelledError
+            priority, _, job = await self.queue.get()
+            try:
+                result = await asyncio.wait_for(job.func(*job.args), self.timeout)
+            except asyncio.TimeoutError as exc:
+                logger.error("Job %s timed out after %ss", job.name, self.timeout)
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as exc:
+                logger.error("Job %s failed", job.name, exc_info=True)
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.queue.task_done()
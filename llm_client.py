@@ -0,0 +1,266 @@
+import re
+import time
+import random
+import asyncio
+import logging
+
+import openai
+
+from metrics import OPENAI_REQUEST_SECONDS, OPENAI_TOKENS
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str | None) -> float | None:
+    """Parses OpenAI reset headers such as ``1s``, ``6m0s`` or ``20ms``."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously. A rate of 0 disables it."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    async def acquire(self, amount: int) -> None:
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self.blocked_until - time.monotonic()
+            if wait <= 0:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60.0 / self.capacity
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount: int) -> None:
+        if self.capacity > 0:
+            self._refill()
+            self.tokens -= amount
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures for ``cooldown`` seconds."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return False
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("OpenAI circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None or not self.is_open:
+                logger.warning("OpenAI circuit breaker opened after %d consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class ResilientClient:
+    """Wraps the async OpenAI client with retries, rate limiting and a breaker.
+
+    Retryable errors (429, 5xx, connection problems and timeouts) are
+    retried with exponential backoff and jitter, honouring ``retry-after``
+    when the server sends one. Requests and tokens per minute are budgeted
+    locally and tightened further from the ``x-ratelimit-*`` response
+    headers. Retryable failures that survive all retries feed a circuit
+    breaker; ``degraded`` reports whether it is currently open. Other
+    errors (bad requests, authentication, ...) say nothing about the
+    health of the API and are raised without touching the breaker.
+    """
+
+    def __init__(self, client: openai.AsyncOpenAI, model: str, max_output_tokens: int,
+                 max_concurrent: int = 4, max_retries: int = 4, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 breaker_threshold: int = 3, breaker_cooldown: float = 300.0) -> None:
+        self.client = client
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.breaker.is_open
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        response = getattr(exc, "response", None)
+        if response is not None:
+            retry_after = parse_duration(response.headers.get("retry-after-ms"))
+            if retry_after is not None:
+                return retry_after / 1000.0
+            retry_after = parse_duration(response.headers.get("retry-after"))
+            if retry_after is not None:
+                return retry_after
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _apply_rate_limit_headers(self, headers) -> None:
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.requests.block(reset)
+        if headers.get("x-ratelimit-remaining-tokens") == "0":
+            reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            if reset:
+                self.tokens.block(reset)
+
+    def _request(self, system_prompt: str, user_prompt: str, cache_key: str | None) -> dict:
+        request = {
+            "model": self.model,
+            "input": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "reasoning": {"effort": "low"},
+            "max_output_tokens": self.max_output_tokens,
+        }
+        if cache_key:
+            request["prompt_cache_key"] = cache_key
+        return request
+
+    async def _retry_or_raise(self, attempt: int, exc: Exception) -> None:
+        if attempt >= self.max_retries:
+            self.breaker.record_failure()
+            raise exc
+        delay = self._backoff(attempt, exc)
+        if isinstance(exc, openai.RateLimitError):
+            self.requests.block(delay)
+        logger.warning("OpenAI request failed (%s); retry %d/%d in %.1fs",
+                       type(exc).__name__, attempt + 1, self.max_retries, delay)
+        await asyncio.sleep(delay)
+
+    async def create(self, system_prompt: str, user_prompt: str, cache_key: str | None = None) -> str:
+        request = self._request(system_prompt, user_prompt, cache_key)
+        estimate = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + self.max_output_tokens
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+            try:
+                async with self.semaphore:
+                    with OPENAI_REQUEST_SECONDS.time(mode="create", outcome="error") as labels:
+                        raw = await self.client.responses.with_raw_response.create(**request)
+                        labels["outcome"] = "ok"
+            except RETRYABLE_ERRORS as exc:
+                await self._retry_or_raise(attempt, exc)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._apply_rate_limit_headers(raw.headers)
+            response = raw.parse()
+            self._record_usage(response, estimate)
+            return response.output_text.strip()
+
+    async def stream(self, system_prompt: str, user_prompt: str, cache_key: str | None = None):
+        """Yields output text deltas as they arrive.
+
+        Failures before the first delta are retried like in ``create``;
+        once text has been yielded an error is raised to the caller.
+        """
+        request = self._request(system_prompt, user_prompt, cache_key)
+        estimate = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + self.max_output_tokens
+        attempt = 0
+        started = False
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+            try:
+                async with self.semaphore:
+                    with OPENAI_REQUEST_SECONDS.time(mode="stream", outcome="error") as labels:
+                        events = await self.client.responses.create(stream=True, **request)
+                        async with events:
+                            self._apply_rate_limit_headers(events.response.headers)
+                            async for event in events:
+                                if event.type == "response.output_text.delta":
+                                    started = True
+                                    labels["outcome"] = "closed"
+                                    yield event.delta
+                                    labels["outcome"] = "error"
+                                elif event.type in ("response.completed", "response.incomplete"):
+                                    self._record_usage(event.response, estimate)
+                        labels["outcome"] = "ok"
+            except RETRYABLE_ERRORS as exc:
+                if started:
+                    self.breaker.record_failure()
+                    raise
+                await self._retry_or_raise(attempt, exc)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return
+
+    def _record_usage(self, response, estimate: int) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        OPENAI_TOKENS.inc(usage.input_tokens, kind="input")
+        OPENAI_TOKENS.inc(usage.output_tokens, kind="output")
+        cached = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", None)
+        if cached:
+            OPENAI_TOKENS.inc(cached, kind="cached_input")
+        self.tokens.adjust(usage.total_tokens - estimate)
+        logger.debug("OpenAI usage: %d input, %d output tokens", usage.input_tokens, usage.output_tokens)
+        if usage.output_tokens >= self.max_output_tokens:
+            logger.warning("OpenAI response hit max_output_tokens (%d); output may be truncated",
+                           self.max_output_tokens)
@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import logging
+import logging.handlers
+from datetime import datetime, timedelta
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# Matches the first line of a record written with the bot's text formatter,
+# "%(asctime)s %(levelname)s:%(name)s:%(message)s", or a JsonFormatter line.
+RECORD_START = re.compile(
+    rb"^(?:\d{4}-\d{2}-\d{2} [\d:,]+ |\{\"time\": \"[^\"]*\", \"level\": \")(DEBUG|INFO|WARNING|ERROR|CRITICAL)[:\"]"
+)
+LOG_FILE = re.compile(r"^[\w.-]+\.log(\.\d+)?$")
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """File handler that rotates at midnight and whenever ``max_bytes`` is exceeded.
+
+    Rotated files get the usual numeric suffixes (``debug.log.1`` is the
+    most recent) and at most ``backup_count`` of them are kept.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, encoding: str = "utf-8") -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        try:
+            opened = datetime.fromtimestamp(os.path.getmtime(self.baseFilename))
+        except OSError:
+            opened = datetime.now()
+        self.rollover_at = self._next_midnight(opened)
+
+    @staticmethod
+    def _next_midnight(moment: datetime) -> float:
+        midnight = datetime.combine(moment.date() + timedelta(days=1), datetime.min.time())
+        return midnight.timestamp()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            if os.path.isfile(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.rollover_at = self._next_midnight(datetime.now())
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = self._next_midnight(datetime.now())
+
+
+def list_log_files(log_dir: str) -> list[str]:
+    return sorted(f for f in os.listdir(log_dir) if LOG_FILE.match(f))
+
+
+def _record_level(record: bytes) -> str | None:
+    match = RECORD_START.match(record)
+    return match.group(1).decode() if match else None
+
+
+def _matches(record: bytes, min_level: int, text: bytes | None) -> bool:
+    if min_level:
+        level = _record_level(record)
+        if level is None or LEVELS.index(level) < min_level:
+            return False
+    return text is None or text in record.lower()
+
+
+def _records_backwards(f, end: int, block_size: int):
+    """Yields ``(offset, record)`` pairs from ``end`` towards the start.
+
+    Continuation lines (tracebacks, multi-line prompts) are kept together
+    with the line that started their record.
+    """
+    pos = end
+    head = b""
+    continuation: list[bytes] = []
+    while pos > 0:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        lines = (f.read(size) + head).split(b"\n")
+        head = lines.pop(0)
+        offset = pos + len(head) + 1
+        offsets = []
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        for line, line_offset in zip(reversed(lines), reversed(offsets)):
+            if RECORD_START.match(line):
+                yield line_offset, b"\n".join([line, *reversed(continuation)])
+                continuation = []
+            elif line:
+                continuation.append(line)
+    if head or continuation:
+        yield 0, b"\n".join([head, *reversed(continuation)]).strip(b"\n")
+
+
+def read_log_page(path: str, before: int | None = None, limit: int = 200, level: str = "",
+                  text: str = "", max_scan_bytes: int = 8 * 1024 * 1024, block_size: int = 64 * 1024):
+    """Reads up to ``limit`` records that end before byte offset ``before``.
+
+    Only the blocks needed are read, from the end of the file backwards,
+    and at most ``max_scan_bytes`` per call so a filter that rarely matches
+    cannot pin the server. Returns the records in file order and the
+    offset to pass as ``before`` for the next (older) page, or ``None``
+    once the start of the file was reached.
+    """
+    min_level = LEVELS.index(level) if level in LEVELS else 0
+    needle = text.lower().encode("utf-8") if text else None
+    records: list[str] = []
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        if before is not None:
+            end = max(0, min(before, end))
+        next_before = None
+        for offset, record in _records_backwards(f, end, block_size):
+            next_before = offset
+            if _matches(record, min_level, needle):
+                records.append(record.decode("utf-8", "replace"))
+                if len(records) >= limit:
+                    break
+            if end - offset >= max_scan_bytes:
+                break
+    records.reverse()
+    return records, next_before or None
+
+
+def follow_log(path: str, level: str = "", text: str = "", poll_interval: float = 1.0,
+               max_seconds: float = 300, heartbeat_seconds: float = 15):
+    """Yields new records appended to ``path`` as they are written.
+
+    Yields ``None`` as a heartbeat when nothing arrived for a while. The
+    file is reopened when it was rotated or truncated. The generator ends
+    after ``max_seconds`` so a forgotten browser tab does not hold a server
+    thread forever; clients are expected to reconnect.
+    """
+    min_level = LEVELS.index(level) if level in LEVELS else 0
+    needle = text.lower().encode("utf-8") if text else None
+    deadline = time.monotonic() + max_seconds
+    last_output = time.monotonic()
+    f = open(path, "rb")
+    try:
+        f.seek(0, os.SEEK_END)
+        inode = os.fstat(f.fileno()).st_ino
+        partial = b""
+        while time.monotonic() < deadline:
+            chunk = f.read()
+            if chunk:
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for line in lines:
+                    if line and _matches(line, min_level, needle):
+                        last_output = time.monotonic()
+                        yield line.decode("utf-8", "replace")
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is not None and (stat.st_ino != inode or stat.st_size < f.tell()):
+                f.close()
+                f = open(path, "rb")
+                inode = os.fstat(f.fileno()).st_ino
+                partial = b""
+                continue
+            if time.monotonic() - last_output >= heartbeat_seconds:
+                last_output = time.monotonic()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        f.close()
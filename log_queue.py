@@ -0,0 +1,77 @@
+import copy
+import json
+import queue
+import logging
+import logging.handlers
+
+# Arguments of these types cannot change after the logging call, so the
+# message can safely be formatted later on the listener thread.
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a ``QueueListener`` without blocking the caller.
+
+    The queue is bounded. DEBUG records are dropped once it is more than
+    ``debug_fill`` full, so a burst of prompt dumps cannot stall the event
+    loop; other records wait for room so warnings and errors are never
+    lost. The number of dropped records is reported with the next record
+    that gets through.
+
+    Unlike the stdlib handler, messages whose arguments are immutable are
+    not formatted here but on the listener thread, which keeps large
+    payloads such as prompts off the caller's thread entirely.
+    """
+
+    def __init__(self, maxsize: int = 10000, debug_fill: float = 0.8) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.debug_limit = max(1, int(maxsize * debug_fill))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        args = record.args
+        if isinstance(record.msg, str) and (not args or (
+                isinstance(args, tuple) and all(isinstance(arg, IMMUTABLE_ARGS) for arg in args))):
+            return record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        debug = record.levelno <= logging.DEBUG
+        if debug and self.queue.qsize() >= self.debug_limit:
+            self.dropped += 1
+            return
+        records = [record]
+        if self.dropped:
+            records.insert(0, logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": "Dropped %d DEBUG log records while the log queue was full",
+                "args": (self.dropped,),
+            }))
+            self.dropped = 0
+        try:
+            for item in records:
+                self.queue.put(item, block=not debug)
+        except queue.Full:
+            self.dropped += 1
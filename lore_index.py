@@ -0,0 +1,148 @@
+import math
+import re
+import logging
+from collections import Counter
+
+from token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset(
+    "der die das den dem des ein eine einen einem einer eines und oder aber auch als an auf aus bei bis "
+    "da dass du er es sie wir ihr ich ist sind war waren wird werden hat haben hatte in im ins mit nach "
+    "nicht noch nur ob ohne sich so um unter vom von vor was wenn wie wo zu zum zur über sein seine ihre "
+    "man mehr sehr schon dann denn doch hier dort the and of to a in is".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def split_chunks(text: str, max_chars: int) -> list[str]:
+    """Splits text at paragraph (and if needed sentence) boundaries."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            if paragraph:
+                pieces.append(paragraph)
+            continue
+        pieces.extend(s for s in _SENTENCE_END.split(paragraph) if s)
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_leading(text: str, max_tokens: int) -> tuple[str, str]:
+    """Splits text after the last whole paragraph that fits in ``max_tokens``."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    used = 0
+    for i, paragraph in enumerate(paragraphs):
+        used += count_tokens(paragraph)
+        if used > max_tokens:
+            return "\n\n".join(paragraphs[:i]), "\n\n".join(paragraphs[i:])
+    return text, ""
+
+
+class _Chunk:
+    __slots__ = ("source", "title", "text", "length", "tokens")
+
+    def __init__(self, source: str, title: str, text: str, length: int) -> None:
+        self.source = source
+        self.title = title
+        self.text = text
+        self.length = length
+        self.tokens = count_tokens(text)
+
+
+class LoreIndex:
+    """In-memory BM25 index over campaign lore.
+
+    Text is registered per source (the world text, one NPC description,
+    ...) and split into paragraph-sized chunks. ``set_source`` replaces
+    only the chunks of that source, so edits update the index
+    incrementally. The title of a source is indexed along with each of its
+    chunks, which lets a query naming an NPC find that NPC's description.
+    The index does no locking of its own; ``Campaign`` updates and searches
+    it under the store lock.
+    """
+
+    def __init__(self, chunk_chars: int = 600, k1: float = 1.5, b: float = 0.75) -> None:
+        self.chunk_chars = chunk_chars
+        self.k1 = k1
+        self.b = b
+        self.chunks: dict[int, _Chunk] = {}
+        self.postings: dict[str, dict[int, int]] = {}
+        self.sources: dict[str, tuple[str, list[int]]] = {}
+        self.total_length = 0
+        self.total_tokens = 0
+        self.next_id = 0
+
+    def set_source(self, source: str, title: str, text: str) -> None:
+        previous = self.sources.get(source)
+        if previous is not None and previous[0] == title + "\0" + text:
+            return
+        self.remove_source(source)
+        ids = []
+        for chunk_text in split_chunks(text, self.chunk_chars):
+            terms = Counter(tokenize(f"{title} {chunk_text}"))
+            chunk_id = self.next_id
+            self.next_id += 1
+            chunk = _Chunk(source, title, chunk_text, sum(terms.values()))
+            self.chunks[chunk_id] = chunk
+            for term, freq in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = freq
+            self.total_length += chunk.length
+            self.total_tokens += chunk.tokens
+            ids.append(chunk_id)
+        self.sources[source] = (title + "\0" + text, ids)
+
+    def remove_source(self, source: str) -> None:
+        entry = self.sources.pop(source, None)
+        if entry is None:
+            return
+        for chunk_id in entry[1]:
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk.length
+            self.total_tokens -= chunk.tokens
+            for term in set(tokenize(f"{chunk.title} {chunk.text}")):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def source_names(self) -> set[str]:
+        return set(self.sources)
+
+    def search(self, query: str, k: int, exclude: frozenset[str] = frozenset()) -> list[tuple[float, _Chunk]]:
+        """Returns the ``k`` best chunks, leaving out the sources in ``exclude``."""
+        if not self.chunks or k <= 0:
+            return []
+        n = len(self.chunks)
+        avg_length = self.total_length / n or 1.0
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings.items():
+                if exclude and self.chunks[chunk_id].source in exclude:
+                    continue
+                length = self.chunks[chunk_id].length
+                norm = freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * length / avg_length))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
@@ -0,0 +1,205 @@
+import time
+import threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name}_total {self.help}", f"# TYPE {self.name}_total counter"]
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}_total{_label_text(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+    def summary(self) -> list[dict]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [{"labels": dict(zip(self.labelnames, key)), "value": _number(v)} for key, v in items]
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; quantiles are estimated from the buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = _Series(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.counts[i] += 1
+                    break
+            series.sum += value
+            series.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block; ``labels`` may be changed inside it."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _quantile(self, series: _Series, q: float) -> float:
+        if not series.count:
+            return 0.0
+        # Linear interpolation within the bucket, as Prometheus'
+        # histogram_quantile does; the open top bucket reports its lower bound.
+        rank = q * series.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series.counts):
+            if count and seen + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            if bound != float("inf"):
+                lower = bound
+        return lower
+
+    def render(self) -> list[str]:
+        lines = []
+        with self.lock:
+            items = sorted(self.values.items())
+            for key, series in items:
+                cumulative = 0
+                for bound, count in zip(self.buckets, series.counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_number(series.sum)}")
+                lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+    def summary(self) -> list[dict]:
+        with self.lock:
+            items = sorted(self.values.items())
+            return [
+                {
+                    "labels": dict(zip(self.labelnames, key)),
+                    "count": series.count,
+                    "avg": series.sum / series.count if series.count else 0.0,
+                    "p50": self._quantile(series, 0.5),
+                    "p99": self._quantile(series, 0.99),
+                }
+                for key, series in items
+            ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[_Metric] = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines += metric.header()
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[dict]:
+        return [
+            {"name": m.name, "help": m.help, "kind": m.kind, "series": m.summary()}
+            for m in self.metrics
+        ]
+
+
+REGISTRY = Registry()
+
+OPENAI_REQUEST_SECONDS = REGISTRY.histogram(
+    "dmhelper_openai_request_seconds", "Duration of single OpenAI API calls", ("mode", "outcome")
+)
+OPENAI_TOKENS = REGISTRY.counter("dmhelper_openai_tokens", "Tokens reported by OpenAI", ("kind",))
+GENERATE_SECONDS = REGISTRY.histogram(
+    "dmhelper_generate_seconds", "Duration of generate_and_send including posting", ("result",)
+)
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter("dmhelper_response_cache_lookups", "Response cache lookups", ("result",))
+HISTORY_SECONDS = REGISTRY.histogram(
+    "dmhelper_history_seconds", "Duration of loading recent channel messages", ("source",)
+)
+NPC_MATCH_SECONDS = REGISTRY.histogram(
+    "dmhelper_npc_match_seconds", "Duration of NPC name matching", ("matched",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+MESSAGES = REGISTRY.counter("dmhelper_messages", "Messages seen by on_message", ("result",))
+AMBIENT_DECISIONS = REGISTRY.counter(
+    "dmhelper_ambient_decisions", "Outcomes of the scheduled ambient post and event checks", ("job", "decision")
+)
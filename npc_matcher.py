@@ -0,0 +1,39 @@
+import re
+
+
+class NpcMatcher:
+    """Finds NPC names in a message with a single precompiled regex.
+
+    A name directly preceded by ``~`` (optionally separated by whitespace)
+    is treated as escaped and does not count as a mention. Matches are
+    mapped back to names by their case fold; the regex folds case a little
+    differently, so a match without a direct hit (``ſtefan`` for
+    ``Stefan``) is resolved by trying the names one by one.
+    """
+
+    def __init__(self, names):
+        self.names = {}
+        for name in names:
+            self.names.setdefault(name.casefold(), name)
+        if self.names:
+            alternatives = "|".join(
+                re.escape(n) for n in sorted(self.names.values(), key=len, reverse=True)
+            )
+            self.pattern = re.compile(rf"(~\s*)?\b({alternatives})\b", re.IGNORECASE)
+        else:
+            self.pattern = None
+
+    def find(self, content: str) -> list[str]:
+        if self.pattern is None:
+            return []
+        found = set()
+        for match in self.pattern.finditer(content):
+            if match.group(1) is None:
+                text = match.group(2)
+                found.add(self.names.get(text.casefold()) or self._resolve(text))
+        return sorted(found)
+
+    def _resolve(self, text: str) -> str:
+        return next(
+            name for name in self.names.values() if re.fullmatch(re.escape(name), text, re.IGNORECASE)
+        )
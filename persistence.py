@@ -0,0 +1,292 @@
+import os
+import json
+import stat
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+from prompt_store import check_unique_keys
+
+logger = logging.getLogger(__name__)
+
+# Read once at import; os.umask can only be queried by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write_json(path: str, data) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file as 0600; keep the mode a plain write would give.
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class DebouncedPersistence(ABC):
+    """Base class for prompt data backends with debounced saving.
+
+    ``schedule_save`` coalesces bursts of edits: the snapshot is taken and
+    written once no further save was requested for ``debounce_seconds``,
+    but never later than ``max_delay_seconds`` after the first pending
+    request. Subclasses implement ``load`` and ``save``; both are called
+    with ``lock`` held. The snapshot itself is taken without ``lock``: it
+    locks the store, whose mutations call ``schedule_save`` while holding
+    the store lock, so taking both here would invert the lock order.
+    """
+
+    def __init__(self, path: str, debounce_seconds: float = 2.0, max_delay_seconds: float = 10.0) -> None:
+        self.path = path
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.lock = threading.RLock()
+        self._timer: threading.Timer | None = None
+        self._snapshot = None
+        self._first_request = 0.0
+        self._taken = 0
+        self._written = 0
+
+    @abstractmethod
+    def load(self) -> dict:
+        ...
+
+    @abstractmethod
+    def save(self, data: dict) -> None:
+        ...
+
+    def schedule_save(self, snapshot) -> None:
+        if self.debounce_seconds <= 0:
+            self.save(snapshot())
+            return
+        with self.lock:
+            now = time.monotonic()
+            if self._timer is None:
+                self._first_request = now
+            else:
+                self._timer.cancel()
+            self._snapshot = snapshot
+            remaining = self.max_delay_seconds - (now - self._first_request)
+            delay = max(0.0, min(self.debounce_seconds, remaining))
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            snapshot, self._snapshot = self._snapshot, None
+            if snapshot is None:
+                return
+            self._taken += 1
+            generation = self._taken
+        try:
+            data = snapshot()
+            with self.lock:
+                # A flush that started later may have written already; any
+                # change after its snapshot has scheduled another save.
+                if generation < self._written:
+                    return
+                self.save(data)
+                self._written = generation
+        except Exception:
+            logger.error("Failed to save prompt data to %s", self.path, exc_info=True)
+
+
+class JsonPersistence(DebouncedPersistence):
+    """Crash-safe writer for the prompt data JSON file.
+
+    Writes go to a temporary file in the same directory which then replaces
+    the target with ``os.replace``, so readers only ever see a complete
+    document.
+    """
+
+    def load(self) -> dict:
+        with self.lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    def save(self, data: dict) -> None:
+        with self.lock:
+            atomic_write_json(self.path, data)
+        logger.debug("Saved prompt data to %s", self.path)
+
+
+# section -> (key column, value columns)
+SQLITE_SECTIONS = {
+    "npc": ("key", ("name", "short", "long")),
+    "spieler": ("name", ("info",)),
+    "tiere": ("name", ("info",)),
+    "user_list": ("username", ("character",)),
+    "weather_table": ("roll", ("description",)),
+}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS npc (key TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, short TEXT NOT NULL, long TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_npc_position ON npc (position);
+CREATE TABLE IF NOT EXISTS spieler (name TEXT PRIMARY KEY, position INTEGER NOT NULL, info TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_spieler_position ON spieler (position);
+CREATE TABLE IF NOT EXISTS tiere (name TEXT PRIMARY KEY, position INTEGER NOT NULL, info TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_tiere_position ON tiere (position);
+CREATE TABLE IF NOT EXISTS user_list (username TEXT PRIMARY KEY, position INTEGER NOT NULL, character TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_user_list_position ON user_list (position);
+CREATE TABLE IF NOT EXISTS weather_table (roll INTEGER PRIMARY KEY, position INTEGER NOT NULL, description TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS events (position INTEGER PRIMARY KEY, npc TEXT NOT NULL, info TEXT NOT NULL);
+"""
+
+
+def _section_rows(section: str, data: dict) -> dict:
+    if section == "npc":
+        return {n["name"].split()[0]: (n["name"], n.get("short", ""), n.get("long", "")) for n in data.get("npc", [])}
+    if section in ("spieler", "tiere"):
+        return {i["name"]: (i.get("info", ""),) for i in data.get(section, [])}
+    if section == "user_list":
+        return {k: (v,) for k, v in data.get("user_list", {}).items()}
+    return {int(k): (v,) for k, v in data.get("weather_table", {}).items()}
+
+
+class SqlitePersistence(DebouncedPersistence):
+    """SQLite backend for prompt data with one table per section.
+
+    ``load`` and ``save`` use the same document layout as the JSON file.
+    ``save`` compares the document with the last loaded or saved state and
+    only writes rows that were added, changed or removed, so editing one
+    NPC touches a single row. If the database is empty and ``json_path``
+    exists, its content is migrated once on first open.
+    """
+
+    def __init__(self, path: str, json_path: str | None = None, debounce_seconds: float = 2.0,
+                 max_delay_seconds: float = 10.0) -> None:
+        super().__init__(path, debounce_seconds, max_delay_seconds)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._rows: dict[str, dict] = {}
+        self._meta: dict[str, str] = {}
+        self._events: list[tuple] = []
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'schema_version'").fetchone() is None:
+            self._migrate(json_path)
+        else:
+            self.load()
+
+    def _migrate(self, json_path: str | None) -> None:
+        data = {}
+        if json_path and os.path.isfile(json_path):
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            logger.info("Migrating prompt data from %s to %s", json_path, self.path)
+        # Rows are keyed like the store, so duplicates would be lost here.
+        check_unique_keys(data)
+        self.save(data)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', '1')")
+
+    def load(self) -> dict:
+        with self.lock:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+            data = {
+                "core": meta.get("core", ""),
+                "welt": meta.get("welt", ""),
+                "spieler": [
+                    {"name": name, "info": info}
+                    for name, info in self.conn.execute("SELECT name, info FROM spieler ORDER BY position")
+                ],
+                "tiere": [
+                    {"name": name, "info": info}
+                    for name, info in self.conn.execute("SELECT name, info FROM tiere ORDER BY position")
+                ],
+                "npc": [
+                    {"name": name, "short": short, "long": long}
+                    for name, short, long in self.conn.execute("SELECT name, short, long FROM npc ORDER BY position")
+                ],
+                "events": [
+                    {"npc": npc, "info": info}
+                    for npc, info in self.conn.execute("SELECT npc, info FROM events ORDER BY position")
+                ],
+                "weather_table": {
+                    str(roll): desc
+                    for roll, desc in self.conn.execute("SELECT roll, description FROM weather_table ORDER BY roll")
+                },
+                "user_list": dict(self.conn.execute("SELECT username, character FROM user_list ORDER BY position")),
+            }
+            data.update(json.loads(meta.get("extra", "{}")))
+            self._remember(data)
+            return data
+
+    def _remember(self, data: dict) -> None:
+        self._rows = {section: _section_rows(section, data) for section in SQLITE_SECTIONS}
+        self._meta = self._meta_rows(data)
+        self._events = [(e.get("npc", ""), e.get("info", "")) for e in data.get("events", [])]
+
+    @staticmethod
+    def _meta_rows(data: dict) -> dict[str, str]:
+        known = {"core", "welt"} | set(SQLITE_SECTIONS) | {"events"}
+        extra = {k: v for k, v in data.items() if k not in known}
+        return {
+            "core": data.get("core", ""),
+            "welt": data.get("welt", ""),
+            "extra": json.dumps(extra, ensure_ascii=False),
+        }
+
+    def save(self, data: dict) -> None:
+        with self.lock, self.conn:
+            written = 0
+            meta = self._meta_rows(data)
+            for key, value in meta.items():
+                if self._meta.get(key) != value:
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+                    written += 1
+            for section, (key_col, value_cols) in SQLITE_SECTIONS.items():
+                old = self._rows.get(section, {})
+                new = _section_rows(section, data)
+                removed = [(k,) for k in old.keys() - new.keys()]
+                if removed:
+                    self.conn.executemany(f"DELETE FROM {section} WHERE {key_col} = ?", removed)
+                position = self.conn.execute(f"SELECT COALESCE(MAX(position), -1) FROM {section}").fetchone()[0]
+                for key, values in new.items():
+                    if key not in old:
+                        position += 1
+                        cols = ", ".join((key_col, "position") + value_cols)
+                        marks = ", ".join("?" * (len(value_cols) + 2))
+                        self.conn.execute(f"INSERT OR REPLACE INTO {section} ({cols}) VALUES ({marks})",
+                                          (key, position) + values)
+                    elif old[key] != values:
+                        assignments = ", ".join(f"{c} = ?" for c in value_cols)
+                        self.conn.execute(f"UPDATE {section} SET {assignments} WHERE {key_col} = ?", values + (key,))
+                    else:
+                        continue
+                    written += 1
+                written += len(removed)
+            events = [(e.get("npc", ""), e.get("info", "")) for e in data.get("events", [])]
+            if events != self._events:
+                self.conn.execute("DELETE FROM events")
+                self.conn.executemany("INSERT INTO events (position, npc, info) VALUES (?, ?, ?)",
+                                      [(i, npc, info) for i, (npc, info) in enumerate(events)])
+                written += len(events) + 1
+            self._remember(data)
+        logger.debug("Saved prompt data to %s (%d rows written)", self.path, written)
@@ -0,0 +1,320 @@
+import logging
+import threading
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+
+def npc_key(name: str) -> str:
+    return name.split()[0]
+
+
+class Npc:
+    __slots__ = ("name", "short", "long")
+
+    def __init__(self, name: str, short: str = "", long: str = "") -> None:
+        self.name = name
+        self.short = short
+        self.long = long
+
+    @property
+    def key(self) -> str:
+        return npc_key(self.name)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "short": self.short, "long": self.long}
+
+
+class Player:
+    __slots__ = ("name", "info")
+
+    def __init__(self, name: str, info: str = "") -> None:
+        self.name = name
+        self.info = info
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "info": self.info}
+
+
+class Animal:
+    __slots__ = ("name", "info")
+
+    def __init__(self, name: str, info: str = "") -> None:
+        self.name = name
+        self.info = info
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "info": self.info}
+
+
+class Event:
+    __slots__ = ("npc", "info")
+
+    def __init__(self, npc: str, info: str = "") -> None:
+        self.npc = npc
+        self.info = info
+
+    def to_dict(self) -> dict:
+        return {"npc": self.npc, "info": self.info}
+
+
+def check_unique_keys(data: dict) -> None:
+    """Raises ``ValueError`` if NPC short names or player or animal names repeat.
+
+    The store and the SQLite backend index these sections by key, so a
+    duplicate would be dropped and then deleted on the next save.
+    """
+    problems = []
+    for section, label, key in (
+        ("npc", "NPC short name", lambda n: npc_key(n["name"])),
+        ("spieler", "player", lambda p: p["name"]),
+        ("tiere", "animal", lambda t: t["name"]),
+    ):
+        seen: dict[str, list[str]] = {}
+        for item in data.get(section, []):
+            seen.setdefault(key(item), []).append(item["name"])
+        problems += [f"{label} {k!r} ({', '.join(names)})" for k, names in seen.items() if len(names) > 1]
+    if problems:
+        raise ValueError("Duplicate entries in prompt data: " + "; ".join(problems))
+
+
+def _locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class PromptStore:
+    """In-memory campaign data with dict indexes for O(1) lookups.
+
+    NPCs are indexed by their short name (first word of the name), players
+    and animals by their full name and Discord users by their username.
+
+    Mutations should go through the methods below, which notify listeners
+    with the set of sections that changed so derived data can be rebuilt
+    selectively. Besides the top-level keys of the JSON document, the NPC
+    section reports ``npc_short`` and ``npc_long`` when only a description
+    changed and the roster itself stayed the same. Mutations and
+    ``to_dict`` hold ``lock`` so a snapshot taken from another thread is
+    always consistent.
+    """
+
+    def __init__(self) -> None:
+        self.core = ""
+        self.welt = ""
+        self.npcs: dict[str, Npc] = {}
+        self.players: dict[str, Player] = {}
+        self.animals: dict[str, Animal] = {}
+        self.events: list[Event] = []
+        self.weather_table: dict[int, str] = {}
+        self.users: dict[str, str] = {}
+        self.memory: dict[str, dict] = {}
+        self.extra: dict = {}
+        self.listeners = []
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PromptStore":
+        check_unique_keys(data)
+        store = cls()
+        store.core = data.get("core", "")
+        store.welt = data.get("welt", "")
+        for n in data.get("npc", []):
+            npc = Npc(n["name"], n.get("short", ""), n.get("long", ""))
+            store.npcs[npc.key] = npc
+        for p in data.get("spieler", []):
+            store.players[p["name"]] = Player(p["name"], p.get("info", ""))
+        for t in data.get("tiere", []):
+            store.animals[t["name"]] = Animal(t["name"], t.get("info", ""))
+        store.events = [Event(e.get("npc", ""), e.get("info", "")) for e in data.get("events", [])]
+        store.weather_table = {int(k): v for k, v in data.get("weather_table", {}).items()}
+        store.users = dict(data.get("user_list", {}))
+        store.memory = {str(k): dict(v) for k, v in data.get("memory", {}).items()}
+        known = {"core", "welt", "npc", "spieler", "tiere", "events", "weather_table", "user_list", "memory"}
+        store.extra = {k: v for k, v in data.items() if k not in known}
+        return store
+
+    @_locked
+    def to_dict(self) -> dict:
+        data = {
+            "core": self.core,
+            "welt": self.welt,
+            "spieler": [p.to_dict() for p in self.players.values()],
+            "tiere": [t.to_dict() for t in self.animals.values()],
+            "npc": [n.to_dict() for n in self.npcs.values()],
+            "events": [e.to_dict() for e in self.events],
+            "weather_table": {str(k): v for k, v in sorted(self.weather_table.items())},
+            "user_list": dict(self.users),
+        }
+        if self.memory:
+            data["memory"] = {k: dict(v, npc=dict(v.get("npc", {}))) for k, v in self.memory.items()}
+        data.update(self.extra)
+        return data
+
+    def get_npc(self, name: str) -> Npc | None:
+        return self.npcs.get(npc_key(name))
+
+    def get_player(self, name: str) -> Player | None:
+        return self.players.get(name)
+
+    def get_animal(self, name: str) -> Animal | None:
+        return self.animals.get(name)
+
+    def get_character(self, username: str) -> str | None:
+        return self.users.get(username)
+
+    def get_memory(self, channel_id: int) -> dict:
+        return self.memory.get(str(channel_id), {})
+
+    def npc_names(self) -> list[str]:
+        return sorted(self.npcs)
+
+    def add_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+    def _changed(self, *sections: str) -> None:
+        changed = set(sections)
+        for listener in self.listeners:
+            listener(changed)
+
+    @_locked
+    def set_core(self, text: str) -> None:
+        if text != self.core:
+            self.core = text
+            self._changed("core")
+
+    @_locked
+    def set_welt(self, text: str) -> None:
+        if text != self.welt:
+            self.welt = text
+            self._changed("welt")
+
+    @_locked
+    def add_npc(self, npc: Npc) -> bool:
+        if npc.key in self.npcs:
+            return False
+        self.npcs[npc.key] = npc
+        self._changed("npc")
+        return True
+
+    @_locked
+    def update_npc(self, key: str, short: str | None = None, long: str | None = None) -> bool:
+        npc = self.npcs.get(key)
+        if npc is None:
+            return False
+        changed = []
+        if short is not None and short != npc.short:
+            npc.short = short
+            changed.append("npc_short")
+        if long is not None and long != npc.long:
+            npc.long = long
+            changed.append("npc_long")
+        if changed:
+            self._changed(*changed)
+        return True
+
+    @_locked
+    def delete_npc(self, key: str) -> bool:
+        if self.npcs.pop(key, None) is None:
+            return False
+        self._changed("npc")
+        return True
+
+    @_locked
+    def add_player(self, player: Player) -> bool:
+        if player.name in self.players:
+            return False
+        self.players[player.name] = player
+        self._changed("spieler")
+        return True
+
+    @_locked
+    def update_player(self, name: str, info: str) -> bool:
+        player = self.players.get(name)
+        if player is None:
+            return False
+        if info != player.info:
+            player.info = info
+            self._changed("spieler")
+        return True
+
+    @_locked
+    def delete_player(self, name: str) -> bool:
+        if self.players.pop(name, None) is None:
+            return False
+        self._changed("spieler")
+        return True
+
+    @_locked
+    def add_animal(self, animal: Animal) -> bool:
+        if animal.name in self.animals:
+            return False
+        self.animals[animal.name] = animal
+        self._changed("tiere")
+        return True
+
+    @_locked
+    def update_animal(self, name: str, info: str) -> bool:
+        animal = self.animals.get(name)
+        if animal is None:
+            return False
+        if info != animal.info:
+            animal.info = info
+            self._changed("tiere")
+        return True
+
+    @_locked
+    def delete_animal(self, name: str) -> bool:
+        if self.animals.pop(name, None) is None:
+            return False
+        self._changed("tiere")
+        return True
+
+    @_locked
+    def add_event(self, event: Event) -> None:
+        self.events.append(event)
+        self._changed("events")
+
+    @_locked
+    def pop_event(self, index: int) -> Event | None:
+        if not 0 <= index < len(self.events):
+            return None
+        event = self.events.pop(index)
+        self._changed("events")
+        return event
+
+    @_locked
+    def remove_event(self, event: Event) -> None:
+        self.events.remove(event)
+        self._changed("events")
+
+    @_locked
+    def set_weather_table(self, table: dict[int, str]) -> None:
+        if table != self.weather_table:
+            self.weather_table = table
+            self._changed("weather_table")
+
+    @_locked
+    def set_user(self, username: str, character: str) -> None:
+        if self.users.get(username) != character:
+            self.users[username] = character
+            self._changed("user_list")
+
+    @_locked
+    def delete_user(self, username: str) -> bool:
+        if self.users.pop(username, None) is None:
+            return False
+        self._changed("user_list")
+        return True
+
+    @_locked
+    def update_memory(self, channel_id: int, summary: str, last_message_id: int,
+                      npc_memories: dict[str, str] | None = None) -> None:
+        memory = self.memory.setdefault(str(channel_id), {})
+        memory["summary"] = summary
+        memory["last_message_id"] = last_message_id
+        if npc_memories:
+            memory.setdefault("npc", {}).update(npc_memories)
+        self._changed("memory")
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingReply:
+    __slots__ = ("channel_id", "npc_names", "messages", "first_seen", "handle")
+
+    def __init__(self, channel_id: int) -> None:
+        self.channel_id = channel_id
+        self.npc_names: list[str] = []
+        self.messages = []
+        self.first_seen = time.monotonic()
+        self.handle: asyncio.TimerHandle | None = None
+
+
+class ReplyCoalescer:
+    """Debounces NPC replies so bursts of triggers share one generation.
+
+    Pending triggers are kept per NPC and channel. A trigger naming an NPC
+    that already has one pending joins it, and if it names NPCs from
+    several pending replies those are merged, so "Agatha" followed by
+    "Agatha und Bruno" becomes one reply by both. Triggers are collected
+    until no new one arrived for ``window`` seconds, or ``max_wait``
+    seconds passed since the first one. ``callback(npc_names, messages)``
+    is then run once with all collected messages. A window of 0 disables
+    coalescing.
+    """
+
+    def __init__(self, callback, window: float, max_wait: float) -> None:
+        self.callback = callback
+        self.window = window
+        self.max_wait = max_wait
+        self.pending: dict[tuple[int, str], _PendingReply] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def submit(self, npc_names: list[str], message) -> None:
+        channel_id = message.channel.id
+        if self.window <= 0:
+            self._spawn(list(npc_names), [message])
+            return
+        found = {id(p): p for p in (self.pending.get((channel_id, name)) for name in npc_names) if p is not None}
+        groups = sorted(found.values(), key=lambda p: p.first_seen)
+        pending = groups[0] if groups else _PendingReply(channel_id)
+        for other in groups:
+            other.handle.cancel()
+            if other is not pending:
+                pending.npc_names += [n for n in other.npc_names if n not in pending.npc_names]
+                pending.messages += other.messages
+        pending.npc_names += [n for n in npc_names if n not in pending.npc_names]
+        pending.messages.append(message)
+        pending.messages.sort(key=lambda m: m.id)
+        for name in pending.npc_names:
+            self.pending[(channel_id, name)] = pending
+        remaining = self.max_wait - (time.monotonic() - pending.first_seen)
+        delay = max(0.0, min(self.window, remaining))
+        pending.handle = asyncio.get_running_loop().call_later(delay, self._fire, pending)
+        logger.debug("Queued trigger for %s (%d pending, firing in %.1fs)",
+                     ", ".join(pending.npc_names), len(pending.messages), delay)
+
+    def _fire(self, pending: _PendingReply) -> None:
+        for name in pending.npc_names:
+            if self.pending.get((pending.channel_id, name)) is pending:
+                del self.pending[(pending.channel_id, name)]
+        self._spawn(pending.npc_names, pending.messages)
+
+    def _spawn(self, npc_names: list[str], messages: list) -> None:
+        task = asyncio.create_task(self._run(npc_names, messages))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, npc_names: list[str], messages: list) -> None:
+        if len(messages) > 1:
+            logger.info("Coalesced %d triggers for %s into one reply", len(messages), ", ".join(npc_names))
+        try:
+            await self.callback(npc_names, messages)
+        except Exception:
+            logger.error("Error while replying as %s", ", ".join(npc_names), exc_info=True)
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """On-disk cache for completions of deterministic prompts.
+
+    Each entry is a small JSON file named after the SHA-256 of model,
+    system prompt and user input. Entries expire after ``ttl_seconds``;
+    once more than ``max_entries`` exist the least recently used ones are
+    removed.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float, max_entries: int) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, system_prompt, user_prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Discarding unreadable response cache entry %s", path, exc_info=True)
+            self._remove(path)
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry.get("response")
+
+    def put(self, key: str, response: str) -> None:
+        atomic_write_json(self._path(key), {"created": time.time(), "response": response})
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") and not name.startswith("."):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def every_hours(hours: int, minute: int = 0):
+    """Schedule for runs at ``minute`` past every ``hours``-th hour of the day."""
+    def next_run(now: datetime) -> datetime:
+        candidate = now.replace(minute=minute, second=0, microsecond=0)
+        candidate -= timedelta(hours=candidate.hour % hours)
+        while candidate <= now:
+            candidate += timedelta(hours=hours)
+        return candidate
+    return next_run
+
+
+def daily(hour: int, minute: int = 0):
+    """Schedule for one run per day at ``hour``:``minute``."""
+    def next_run(now: datetime) -> datetime:
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        return candidate
+    return next_run
+
+
+class _CronJob:
+    __slots__ = ("name", "func", "schedule", "jitter", "misfire_grace", "next_run")
+
+    def __init__(self, name, func, schedule, jitter, misfire_grace) -> None:
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.misfire_grace = misfire_grace
+        self.next_run: datetime | None = None
+
+
+class Scheduler:
+    """Runs coroutine functions at wall-clock times.
+
+    Every job sleeps until exactly its next scheduled time (plus up to
+    ``jitter`` random seconds), so nothing wakes up just to check the
+    clock. Since the sleep uses the monotonic clock, the wall clock is
+    re-checked on waking and the job sleeps again if it moved back. A run
+    that fires more than ``misfire_grace`` seconds late, e.g. after the
+    host was suspended, is skipped; with ``misfire_grace=None`` it runs
+    once. ``start`` is idempotent, so a reconnect firing ``on_ready``
+    again does not start the jobs twice.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: list[_CronJob] = []
+        self.tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, func, schedule, jitter: float = 0.0, misfire_grace: float | None = None) -> None:
+        self.jobs.append(_CronJob(name, func, schedule, jitter, misfire_grace))
+
+    def start(self) -> None:
+        if self.tasks:
+            logger.debug("Scheduler already running")
+            return
+        self.tasks = [asyncio.create_task(self._run(job), name=f"cron-{job.name}") for job in self.jobs]
+        logger.info("Scheduler started with %d jobs", len(self.jobs))
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _run(self, job: _CronJob) -> None:
+        while True:
+            scheduled = job.schedule(datetime.now())
+            target = scheduled + timedelta(seconds=random.uniform(0, job.jitter))
+            job.next_run = target
+            logger.debug("Next %s run at %s", job.name, target.isoformat(timespec="seconds"))
+            while (delay := (target - datetime.now()).total_seconds()) > 0:
+                await asyncio.sleep(delay)
+            late = (datetime.now() - target).total_seconds()
+            if job.misfire_grace is not None and late > job.misfire_grace:
+                logger.warning("Skipped %s run scheduled for %s (%.0fs late)", job.name, scheduled, late)
+                continue
+            try:
+                await job.func(scheduled)
+            except Exception:
+                logger.error("Scheduled job %s failed", job.name, exc_info=True)
@@ -0,0 +1,50 @@
+import os
+import json
+import logging
+import threading
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerState:
+    """Scheduler state of all campaigns, kept in one small JSON file.
+
+    Entries are keyed by channel id and hold whatever the scheduler needs
+    to survive a restart (the current weather, the day it was rolled for
+    and the event chance). Every update is written through immediately;
+    updates happen a few times a day at most.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.channels: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.error("Could not read scheduler state from %s; starting fresh", self.path, exc_info=True)
+            return {}
+
+    def get(self, channel_id: int) -> dict:
+        with self.lock:
+            return dict(self.channels.get(str(channel_id), {}))
+
+    def update(self, channel_id: int, values: dict) -> None:
+        with self.lock:
+            entry = self.channels.setdefault(str(channel_id), {})
+            if all(entry.get(k) == v for k, v in values.items()):
+                return
+            entry.update(values)
+            try:
+                atomic_write_json(self.path, self.channels)
+            except OSError:
+                logger.error("Could not save scheduler state to %s", self.path, exc_info=True)
+                return
+        logger.debug("Saved scheduler state for channel %s", channel_id)
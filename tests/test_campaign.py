@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+from campaign import WORLD_TITLE, Campaign, CampaignRegistry
+from persistence import JsonPersistence
+from prompt_store import Npc
+
+
+def make_campaign(tmp_path) -> Campaign:
+    path = tmp_path / "prompt_data.json"
+    path.write_text(json.dumps({"core": "Kern", "npc": [{"name": "Agatha Kleinschürz", "short": "Wirtin"}]}))
+    campaign = Campaign(1, JsonPersistence(str(path), debounce_seconds=60))
+    campaign.load()
+    return campaign
+
+
+def test_static_prompt_waits_for_change_from_other_thread(tmp_path):
+    campaign = make_campaign(tmp_path)
+    assert "Agatha" in campaign.static_prompt(())
+    applying = threading.Event()
+
+    def slow_listener(changed):
+        applying.set()
+        # Give the prompt below time to be built before apply_changes ran.
+        time.sleep(0.2)
+
+    campaign.store.listeners.insert(0, slow_listener)
+    mutator = threading.Thread(target=campaign.store.add_npc, args=(Npc("Bruno Eisenfaust", "Schmied"),))
+    mutator.start()
+    assert applying.wait(5)
+    prompt = campaign.static_prompt(())
+    mutator.join(5)
+    assert "Bruno Eisenfaust: Schmied" in prompt
+    assert "Bruno Eisenfaust: Schmied" in campaign.static_prompt(())
+
+
+def test_small_world_and_mentioned_npcs_survive_large_lore(tmp_path):
+    lore = " ".join(f"Geschichte{i} vom Fluss und vom Dschungel." for i in range(300))
+    data = {
+        "welt": "Es gibt nur Chult, keine anderen Städte.",
+        "npc": [
+            {"name": "Agatha Kleinschürz", "short": "Wirtin", "long": "Agatha kocht. " + lore},
+            {"name": "Bruno Eisenfaust", "short": "Schmied", "long": "Bruno schmiedet. " + lore},
+            {"name": "Cora Nebel", "short": "Jägerin", "long": "Cora jagt im Dschungel. " + lore},
+        ],
+    }
+    path = tmp_path / "prompt_data.json"
+    path.write_text(json.dumps(data))
+    campaign = Campaign(1, JsonPersistence(str(path)), retrieval_top_k=6, retrieval_min_lore_tokens=100)
+    campaign.load()
+    assert campaign.use_retrieval()
+
+    prompt = campaign.static_prompt(("Agatha", "Bruno"))
+    assert WORLD_TITLE + "\nEs gibt nur Chult, keine anderen Städte." in prompt
+    assert "Agatha kocht." in prompt and "Bruno schmiedet." in prompt
+    assert "Cora jagt" not in prompt
+
+    lore_text = campaign.retrieve_lore("Dschungel", ["Agatha", "Bruno"])
+    assert "Cora Nebel:" in lore_text
+    assert "Agatha Kleinschürz:" not in lore_text and "Bruno Eisenfaust:" not in lore_text
+
+
+def test_campaigns_with_jobs_are_not_evicted(tmp_path):
+    registry = CampaignRegistry(lambda channel_id: make_campaign(tmp_path), [1, 2, 3], 1, idle_seconds=0.01)
+    default, busy = registry.default, registry.get(2)
+    registry.get(3)
+    busy.jobs = 1
+    time.sleep(0.05)
+    registry.evict_idle()
+    assert registry.loaded() == [default, busy]
+    busy.jobs = 0
+    registry.evict_idle()
+    assert registry.loaded() == [default]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from benchmarks.fake_backends import FakeResponsesServer
+from llm_client import ResilientClient
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = FakeResponsesServer(latency=0, jitter=0, none_rate=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def reset(server):
+    server.errors = []
+    server.requests = 0
+
+
+def run(server, call, **kwargs):
+    async def main():
+        client = openai.AsyncOpenAI(api_key="test", base_url=server.url, max_retries=0)
+        llm = ResilientClient(client, "fake", 100, backoff_base=0.01, **kwargs)
+        try:
+            return llm, await call(llm)
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_retries_honour_retry_after(server):
+    server.errors = [(429, {"retry-after": "0.3"}), (500, {})]
+    started = time.monotonic()
+    llm, text = run(server, lambda llm: llm.create("system", "user"))
+    assert isinstance(text, str) and text
+    assert server.requests == 3
+    assert time.monotonic() - started >= 0.3
+    assert llm.breaker.failures == 0
+
+
+def test_stream_retries_before_first_delta(server):
+    server.errors = [(503, {})]
+
+    async def collect(llm):
+        return "".join([delta async for delta in llm.stream("system", "user")])
+
+    llm, text = run(server, collect)
+    assert isinstance(text, str) and text
+    assert server.requests == 2
+
+
+def test_breaker_opens_after_retries_are_exhausted(server):
+    server.errors = [(500, {})] * 4
+
+    async def twice(llm):
+        for _ in range(2):
+            try:
+                await llm.create("system", "user")
+            except openai.InternalServerError:
+                pass
+
+    llm, _ = run(server, twice, max_retries=1, breaker_threshold=2)
+    assert server.requests == 4
+    assert llm.degraded
+
+
+def test_client_errors_do_not_trip_the_breaker(server):
+    server.errors = [(400, {}), (401, {})]
+
+    async def twice(llm):
+        for _ in range(2):
+            try:
+                await llm.create("system", "user")
+            except (openai.BadRequestError, openai.AuthenticationError):
+                pass
+
+    llm, _ = run(server, twice, breaker_threshold=1)
+    assert server.requests == 2
+    assert llm.breaker.failures == 0 and not llm.degraded
@@ -0,0 +1,48 @@
+from log_files import read_log_page
+
+
+def write_log(path) -> list[str]:
+    records = []
+    for i in range(40):
+        level = "ERROR" if i % 5 == 0 else "INFO"
+        record = f"2024-05-01 12:00:{i:02d},000 {level}:bot:Nachricht {i} " + "x" * (i % 7)
+        if level == "ERROR":
+            record += f"\nTraceback (most recent call last):\n  File \"bot.py\", line {i}\nValueError: kaputt {i}"
+        records.append(record)
+    path.write_text("\n".join(records) + "\n", encoding="utf-8")
+    return records
+
+
+def read_all(path, **kwargs) -> list[str]:
+    pages = []
+    before = None
+    while True:
+        records, before = read_log_page(str(path), before, **kwargs)
+        pages.insert(0, records)
+        if before is None:
+            return [record for page in pages for record in page]
+
+
+def test_pages_return_every_record_once_in_order(tmp_path):
+    path = tmp_path / "info.log"
+    records = write_log(path)
+    assert read_all(path, limit=7, block_size=64) == records
+    assert read_all(path, limit=1000, block_size=13) == records
+
+
+def test_level_and_text_filters(tmp_path):
+    path = tmp_path / "info.log"
+    records = write_log(path)
+    errors = [r for r in records if " ERROR:" in r]
+    assert read_all(path, limit=3, level="ERROR", block_size=64) == errors
+    assert read_all(path, limit=3, text="KAPUTT 1", block_size=64) == [r for r in errors if "kaputt 1" in r]
+
+
+def test_scan_cap_pages_through_rare_matches(tmp_path):
+    path = tmp_path / "info.log"
+    records = write_log(path)
+    first, before = read_log_page(str(path), limit=10, level="ERROR", max_scan_bytes=200, block_size=64)
+    assert len(first) < 8 and before is not None
+    assert read_all(path, limit=10, level="ERROR", max_scan_bytes=200, block_size=64) == [
+        r for r in records if " ERROR:" in r
+    ]
@@ -0,0 +1,11 @@
+from npc_matcher import NpcMatcher
+
+
+def test_case_folded_spellings_map_to_the_name():
+    matcher = NpcMatcher(["Stefan", "Strauß", "Kai"])
+    assert matcher.find("hallo ſtefan") == ["Stefan"]
+    assert matcher.find("STRAUẞ und Kai") == ["Kai", "Strauß"]
+
+
+def test_escaped_names_are_ignored():
+    assert NpcMatcher(["Agatha", "Bruno"]).find("~Agatha und ~ bruno, aber BRUNO") == ["Bruno"]
@@ -0,0 +1,128 @@
+import json
+import os
+import stat
+import threading
+import time
+
+from persistence import JsonPersistence, SqlitePersistence, atomic_write_json
+from prompt_store import PromptStore
+
+
+def test_flush_and_store_mutation_do_not_deadlock(tmp_path):
+    path = tmp_path / "prompt_data.json"
+    persistence = JsonPersistence(str(path), debounce_seconds=60)
+    store = PromptStore()
+    store.add_listener(lambda changed: persistence.schedule_save(store.to_dict))
+    in_snapshot = threading.Event()
+
+    def slow_snapshot():
+        in_snapshot.set()
+        # Give the mutation below time to take the store lock first.
+        time.sleep(0.2)
+        return store.to_dict()
+
+    persistence.schedule_save(slow_snapshot)
+    flusher = threading.Thread(target=persistence.flush, daemon=True)
+    flusher.start()
+    assert in_snapshot.wait(5)
+    mutator = threading.Thread(target=store.set_core, args=("neu",), daemon=True)
+    mutator.start()
+    flusher.join(5)
+    mutator.join(5)
+    assert not flusher.is_alive() and not mutator.is_alive(), "flush and mutation deadlocked"
+
+    persistence.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["core"] == "neu"
+
+
+def test_older_snapshot_does_not_overwrite_newer_one(tmp_path):
+    path = tmp_path / "prompt_data.json"
+    persistence = JsonPersistence(str(path), debounce_seconds=60)
+    release = threading.Event()
+
+    def stale_snapshot():
+        release.wait(5)
+        return {"core": "alt"}
+
+    persistence.schedule_save(stale_snapshot)
+    slow = threading.Thread(target=persistence.flush, daemon=True)
+    slow.start()
+    time.sleep(0.05)
+    persistence.schedule_save(lambda: {"core": "neu"})
+    persistence.flush()
+    release.set()
+    slow.join(5)
+
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["core"] == "neu"
+
+
+def sample_data() -> dict:
+    return {
+        "core": "Kern",
+        "welt": "Nur Chult.",
+        "spieler": [{"name": "Aria Sturmwind", "info": "Waldläuferin"}, {"name": "Borin", "info": "Zwerg"}],
+        "tiere": [{"name": "Papagei", "info": "laut"}],
+        "npc": [
+            {"name": "Agatha Kleinschürz", "short": "Wirtin", "long": "lang"},
+            {"name": "Bruno Eisenfaust", "short": "Schmied", "long": ""},
+            {"name": "Cora Nebel", "short": "Jägerin", "long": "Spurenleserin"},
+        ],
+        "events": [{"npc": "Agatha", "info": "Fest"}, {"npc": "", "info": "Sturm"}],
+        "weather_table": {"1": "Regen", "2": "Sonne"},
+        "user_list": {"aria": "Aria Sturmwind"},
+        "memory": {"42": {"summary": "Bisher", "last_message_id": 7, "npc": {"Agatha": "kennt Aria"}}},
+        "version": 3,
+    }
+
+
+def test_sqlite_migration_round_trip(tmp_path):
+    json_path = tmp_path / "prompt_data.json"
+    json_path.write_text(json.dumps(sample_data()), encoding="utf-8")
+    persistence = SqlitePersistence(str(tmp_path / "prompt_data.sqlite3"), str(json_path), debounce_seconds=0)
+    assert persistence.load() == sample_data()
+
+
+def test_sqlite_npc_edit_writes_one_row(tmp_path):
+    persistence = SqlitePersistence(str(tmp_path / "prompt_data.sqlite3"), debounce_seconds=0)
+    persistence.save(sample_data())
+    data = sample_data()
+    data["npc"][1]["short"] = "Waffenschmied"
+    before = persistence.conn.total_changes
+    persistence.save(data)
+    assert persistence.conn.total_changes - before == 1
+    assert persistence.load()["npc"][1]["short"] == "Waffenschmied"
+
+
+def test_sqlite_delete_and_re_add_keeps_document_order(tmp_path):
+    persistence = SqlitePersistence(str(tmp_path / "prompt_data.sqlite3"), debounce_seconds=0)
+    data = sample_data()
+    persistence.save(data)
+    bruno = data["npc"].pop(1)
+    persistence.save(data)
+    data["npc"].append(bruno)
+    persistence.save(data)
+    assert [n["name"] for n in persistence.load()["npc"]] == [n["name"] for n in data["npc"]]
+
+
+def test_sqlite_memory_and_extra_keys_survive_reload(tmp_path):
+    path = str(tmp_path / "prompt_data.sqlite3")
+    SqlitePersistence(path, debounce_seconds=0).save(sample_data())
+    data = SqlitePersistence(path, debounce_seconds=0).load()
+    assert data["memory"] == sample_data()["memory"]
+    assert data["version"] == 3
+
+
+def test_atomic_write_keeps_file_mode(tmp_path):
+    path = tmp_path / "prompt_data.json"
+    path.write_text("{}")
+    os.chmod(path, 0o644)
+    atomic_write_json(str(path), {"core": "neu"})
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+    new_path = tmp_path / "scheduler_state.json"
+    atomic_write_json(str(new_path), {})
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(new_path).st_mode) == 0o666 & ~umask
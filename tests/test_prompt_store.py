@@ -0,0 +1,40 @@
+import logging
+
+import pytest
+
+import web
+from prompt_store import Npc, Player, PromptStore
+
+
+def test_from_dict_rejects_duplicate_keys():
+    data = {
+        "npc": [{"name": "Agatha Kleinschürz"}, {"name": "Agatha Zweite"}],
+        "spieler": [{"name": "Aria", "info": "a"}, {"name": "Aria", "info": "b"}],
+    }
+    with pytest.raises(ValueError, match="Agatha Kleinschürz, Agatha Zweite") as excinfo:
+        PromptStore.from_dict(data)
+    assert "'Aria'" in str(excinfo.value)
+
+
+def test_add_does_not_overwrite_existing_entries():
+    store = PromptStore.from_dict({"npc": [{"name": "Agatha Kleinschürz", "short": "Köchin", "long": "lang"}]})
+    assert not store.add_npc(Npc("Agatha Zweite", "andere"))
+    assert store.npcs["Agatha"].name == "Agatha Kleinschürz"
+    assert store.npcs["Agatha"].long == "lang"
+    assert store.add_player(Player("Aria", "info"))
+    assert not store.add_player(Player("Aria", "anders"))
+    assert store.players["Aria"].info == "info"
+
+
+def test_add_npc_route_reports_collision(tmp_path):
+    store = PromptStore.from_dict({"npc": [{"name": "Agatha Kleinschürz", "short": "Köchin", "long": "lang"}]})
+    app = web.create_web_app({}, lambda: store, lambda: None, str(tmp_path), "u", "p", str(tmp_path), "test",
+                             logging.getLogger("test"))
+    client = app.test_client()
+    client.post("/login", data={"username": "u", "password": "p"})
+
+    response = client.post("/add", data={"name": "Agatha Zweite", "short": "andere", "long": ""})
+
+    assert response.status_code == 409
+    assert "Kurznamen Agatha" in response.get_data(as_text=True)
+    assert store.npcs["Agatha"].name == "Agatha Kleinschürz"
@@ -0,0 +1,37 @@
+import asyncio
+from types import SimpleNamespace
+
+from reply_coalescer import ReplyCoalescer
+
+CHANNEL = SimpleNamespace(id=1)
+
+
+def message(message_id: int):
+    return SimpleNamespace(id=message_id, channel=CHANNEL)
+
+
+def run_triggers(triggers) -> list:
+    calls = []
+
+    async def callback(npc_names, messages):
+        calls.append((npc_names, [m.id for m in messages]))
+
+    async def main():
+        coalescer = ReplyCoalescer(callback, window=0.05, max_wait=1)
+        for npc_names, message_id in triggers:
+            coalescer.submit(npc_names, message(message_id))
+        await asyncio.sleep(0.2)
+        await asyncio.gather(*coalescer.tasks)
+
+    asyncio.run(main())
+    return calls
+
+
+def test_overlapping_npc_sets_share_one_reply():
+    calls = run_triggers([(["Agatha"], 1), (["Agatha", "Bruno"], 2), (["Bruno"], 3)])
+    assert calls == [(["Agatha", "Bruno"], [1, 2, 3])]
+
+
+def test_separate_pending_replies_are_merged():
+    calls = run_triggers([(["Agatha"], 1), (["Bruno"], 2), (["Cora"], 3), (["Bruno", "Agatha"], 4)])
+    assert sorted(calls) == [(["Agatha", "Bruno"], [1, 2, 4]), (["Cora"], [3])]
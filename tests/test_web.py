@@ -0,0 +1,41 @@
+import json
+import logging
+
+import bot
+import web
+from prompt_store import PromptStore
+
+
+def test_live_log_tails_are_capped(tmp_path):
+    (tmp_path / "bot.log").write_text("")
+    config = {"logging": {"max_live_tails": 1, "tail_max_seconds": 1}}
+    store = PromptStore()
+    app = web.create_web_app(config, lambda: store, lambda: None, str(tmp_path), "u", "p", str(tmp_path), "test",
+                             logging.getLogger("test"))
+    client = app.test_client()
+    client.post("/login", data={"username": "u", "password": "p"})
+
+    first = client.get("/logs/stream?log=bot.log")
+    assert first.status_code == 200
+    refused = client.get("/logs/stream?log=bot.log")
+    assert refused.status_code == 503
+    first.close()
+    second = client.get("/logs/stream?log=bot.log")
+    assert second.status_code == 200
+    second.close()
+
+
+def test_settings_post_rebuilds_bot_settings(tmp_path):
+    config = bot.load_config()
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    env = {"CHANNEL_ID": "1", "WEB_USERNAME": "u", "WEB_PASSWORD": "p"}
+    app = bot.create_app(str(tmp_path), config, env)
+    client = app.web_app.test_client()
+    client.post("/login", data={"username": "u", "password": "p"})
+
+    changed = dict(config, discord=dict(config["discord"], silent_hours=[1, 2]))
+    changed.pop("webserver")
+    response = client.post("/settings", data={"config": json.dumps(changed)})
+
+    assert response.status_code == 302
+    assert (app.settings.silent_hours_start, app.settings.silent_hours_end) == (1, 2)
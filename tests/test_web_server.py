@@ -0,0 +1,38 @@
+import logging
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+from flask import Flask
+
+from web_server import WebServer
+
+
+def test_stop_lets_requests_in_flight_finish_cleanly(caplog):
+    pytest.importorskip("waitress")
+    app = Flask("test")
+
+    @app.route("/slow")
+    def slow():
+        time.sleep(0.5)
+        return "ok"
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = WebServer(app, "127.0.0.1", port, threads=2, shutdown_timeout=5)
+    server.start()
+    time.sleep(0.2)
+    replies = []
+    client = threading.Thread(target=lambda: replies.append(urllib.request.urlopen(f"http://127.0.0.1:{port}/slow").read()))
+    client.start()
+    time.sleep(0.1)
+
+    with caplog.at_level(logging.ERROR):
+        server.stop()
+        client.join(5)
+
+    assert replies == [b"ok"]
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
@@ -0,0 +1,65 @@
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            logger.warning("tiktoken encoding unavailable; estimating token counts", exc_info=True)
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken if installed, else estimates ~4 chars per token."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cuts ``text`` down to ``budget`` tokens, keeping its end."""
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[-budget:])
+    return text[-budget * 4:]
+
+
+def select_within_budget(items, budget: int):
+    """Picks items in priority order while they fit into ``budget`` tokens.
+
+    ``items`` is an iterable of ``(section, key, text)``. Items that do not
+    fit are skipped, smaller ones further down may still be taken. Returns
+    the set of chosen ``(section, key)`` pairs and the tokens used per
+    section.
+    """
+    chosen = set()
+    used: dict[str, int] = {}
+    remaining = budget
+    for section, key, text in items:
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            continue
+        remaining -= tokens
+        chosen.add((section, key))
+        used[section] = used.get(section, 0) + tokens
+    return chosen, used
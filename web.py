@@ -1,76 +1,117 @@
 import os
 import json
+import time
+import threading
 from functools import wraps
-from flask import Flask, request, session, redirect, url_for, render_template
-
-app = Flask(__name__)
-
-CONFIG = {}
-GET_PROMPT_DATA = None
-SAVE_PROMPT_DATA = None
-REFRESH_DATA = None
-LOG_DIR = ""
-WEB_USERNAME = ""
-WEB_PASSWORD = ""
-BASE_DIR = ""
-logger = None
-
-def init_web(config, get_prompt_data, save_prompt_data, refresh_data,
-             log_dir, username, password, base_dir, secret_key, log):
-    global CONFIG, GET_PROMPT_DATA, SAVE_PROMPT_DATA, REFRESH_DATA
-    global LOG_DIR, WEB_USERNAME, WEB_PASSWORD, BASE_DIR, logger
-    CONFIG = config
-    GET_PROMPT_DATA = get_prompt_data
-    SAVE_PROMPT_DATA = save_prompt_data
-    REFRESH_DATA = refresh_data
-    LOG_DIR = log_dir
-    WEB_USERNAME = username
-    WEB_PASSWORD = password
-    BASE_DIR = base_dir
-    logger = log
+from flask import Blueprint, Flask, Response, current_app, request, session, redirect, url_for, render_template, g
+from werkzeug.local import LocalProxy
+from prompt_store import Npc, Player, Animal, Event
+from log_files import LEVELS, list_log_files, read_log_page, follow_log
+from metrics import REGISTRY
+
+panel = Blueprint("panel", __name__)
+
+class PanelContext:
+    """What the panel needs from the bot; one per Flask app."""
+
+    def __init__(self, config, get_store, refresh_data, log_dir, username, password, base_dir, log):
+        self.config = config
+        self.get_store = get_store
+        self.refresh_data = refresh_data
+        self.log_dir = log_dir
+        self.username = username
+        self.password = password
+        self.base_dir = base_dir
+        self.logger = log
+        # Every live tail holds a server thread until it ends.
+        self.live_tails = threading.BoundedSemaphore(config.get("logging", {}).get("max_live_tails", 2))
+
+def _context() -> PanelContext:
+    return current_app.extensions["panel"]
+
+logger = LocalProxy(lambda: _context().logger)
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+def log_request_time(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    response.headers["Server-Timing"] = f"app;dur={elapsed_ms:.1f}"
+    slow_ms = _context().config.get("webserver", {}).get("slow_request_ms", 1000)
+    if elapsed_ms >= slow_ms:
+        logger.warning("Slow request %s %s: %d in %.0f ms", request.method, request.path, response.status_code, elapsed_ms)
+    else:
+        logger.debug("%s %s: %d in %.1f ms", request.method, request.path, response.status_code, elapsed_ms)
+    return response
+
+def create_web_app(config, get_store, refresh_data,
+                   log_dir, username, password, base_dir, secret_key, log) -> Flask:
+    app = Flask(__name__)
     app.secret_key = secret_key
+    app.extensions["panel"] = PanelContext(
+        config, get_store, refresh_data, log_dir, username, password, base_dir, log
+    )
+    app.before_request(start_timer)
+    app.after_request(log_request_time)
+    app.register_blueprint(panel)
+    return app
 
 def login_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         if not session.get("logged_in"):
-            return redirect(url_for("login"))
+            return redirect(url_for(".login"))
         return func(*args, **kwargs)
     return wrapper
 
-@app.route("/login", methods=["GET", "POST"])
+@panel.route("/metrics")
+def metrics():
+    # Scrapers cannot log in through the form, so HTTP basic auth with the
+    # panel credentials is accepted here as well.
+    context = _context()
+    auth = request.authorization
+    basic_ok = auth is not None and auth.username == context.username and auth.password == context.password
+    if not session.get("logged_in") and not basic_ok:
+        return Response("Unauthorized", 401, {"WWW-Authenticate": 'Basic realm="metrics"'})
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@panel.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
-        if username == WEB_USERNAME and password == WEB_PASSWORD:
+        context = _context()
+        if username == context.username and password == context.password:
             session["logged_in"] = True
             logger.info("User %s logged in", username)
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
         logger.warning("Failed login attempt for user %s", username)
     return render_template("login.html")
 
-@app.route("/logout")
+@panel.route("/logout")
 def logout():
     session.pop("logged_in", None)
     logger.info("User logged out")
-    return redirect(url_for("login"))
+    return redirect(url_for(".login"))
 
-@app.route("/")
+@panel.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/prompt_data")
+@panel.route("/prompt_data")
 @login_required
 def prompt_data():
-    data = GET_PROMPT_DATA()
-    npc_count = len(data.get("npc", []))
-    player_count = len(data.get("spieler", []))
-    animal_count = len(data.get("tiere", []))
-    event_count = len(data.get("events", []))
-    user_count = len(data.get("user_list", {}))
-    core_text = "vorhanden" if data.get("core") else "nicht gesetzt"
-    world_text = "vorhanden" if data.get("welt") else "nicht gesetzt"
+    store = _context().get_store()
+    npc_count = len(store.npcs)
+    player_count = len(store.players)
+    animal_count = len(store.animals)
+    event_count = len(store.events)
+    user_count = len(store.users)
+    core_text = "vorhanden" if store.core else "nicht gesetzt"
+    world_text = "vorhanden" if store.welt else "nicht gesetzt"
     return render_template(
         "prompt_data.html",
         npc_count=npc_count,
@@ -80,16 +121,16 @@ def prompt_data():
         user_count=user_count,
         core_text=core_text,
         world_text=world_text,
+        metrics=REGISTRY.summary(),
     )
 
-@app.route("/npcs")
+@panel.route("/npcs")
 @login_required
 def npc_list():
-    data = GET_PROMPT_DATA()
-    all_npcs = sorted(n["name"].split()[0] for n in data.get("npc", []))
+    all_npcs = _context().get_store().npc_names()
     return render_template("npc_list.html", npcs=all_npcs)
 
-@app.route("/add", methods=["GET", "POST"])
+@panel.route("/add", methods=["GET", "POST"])
 @login_required
 def add_npc():
     if request.method == "POST":
@@ -97,300 +138,300 @@ def add_npc():
         short = request.form.get("short", "").strip()
         long = request.form.get("long", "").strip()
         if name and short:
-            data = GET_PROMPT_DATA()
-            npc_list = data.setdefault("npc", [])
-            npc_list.append({"name": name, "short": short, "long": long})
-            SAVE_PROMPT_DATA(data)
-            REFRESH_DATA()
-            logger.info("Added NPC %s", name)
-            return redirect(url_for("npc_list"))
+            store = _context().get_store()
+            npc = Npc(name, short, long)
+            if store.add_npc(npc):
+                logger.info("Added NPC %s", name)
+                return redirect(url_for(".npc_list"))
+            logger.warning("NPC %s not added: short name %s already taken", name, npc.key)
+            error = f"Es gibt bereits einen NPC mit dem Kurznamen {npc.key}."
+            return render_template("add_npc.html", error=error, name=name, short=short, long=long), 409
     return render_template("add_npc.html")
 
-@app.route("/edit/<name>", methods=["GET", "POST"])
+@panel.route("/edit/<name>", methods=["GET", "POST"])
 @login_required
 def edit_npc(name):
-    data = GET_PROMPT_DATA()
-    npc_list = data.get("npc", [])
-    npc = next((n for n in npc_list if n["name"].split()[0] == name), None)
+    store = _context().get_store()
+    npc = store.npcs.get(name)
     if npc is None:
         logger.warning("NPC %s not found", name)
         return "NPC not found", 404
     if request.method == "POST":
-        npc["short"] = request.form.get("short", "").strip()
-        npc["long"] = request.form.get("long", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.update_npc(
+            name,
+            short=request.form.get("short", "").strip(),
+            long=request.form.get("long", "").strip(),
+        )
         logger.info("Edited NPC %s", name)
-        return redirect(url_for("npc_list"))
-    short_text = npc.get("short", "")
-    long_text = npc.get("long", "")
+        return redirect(url_for(".npc_list"))
     return render_template(
         "edit_npc.html",
         name=name,
-        short=short_text,
-        long=long_text,
+        short=npc.short,
+        long=npc.long,
     )
 
-@app.route("/delete/<name>")
+@panel.route("/delete/<name>")
 @login_required
 def delete_npc(name):
-    data = GET_PROMPT_DATA()
-    npc_list = data.get("npc", [])
-    data["npc"] = [n for n in npc_list if n["name"].split()[0] != name]
-    SAVE_PROMPT_DATA(data)
-    REFRESH_DATA()
+    store = _context().get_store()
+    store.delete_npc(name)
     logger.info("Deleted NPC %s", name)
-    return redirect(url_for("npc_list"))
+    return redirect(url_for(".npc_list"))
 
-@app.route("/players")
+@panel.route("/players")
 @login_required
 def player_list():
-    data = GET_PROMPT_DATA()
-    players = sorted(p["name"] for p in data.get("spieler", []))
+    players = sorted(_context().get_store().players)
     return render_template("player_list.html", players=players)
 
-@app.route("/players/add", methods=["GET", "POST"])
+@panel.route("/players/add", methods=["GET", "POST"])
 @login_required
 def add_player():
     if request.method == "POST":
         name = request.form.get("name", "").strip()
         info = request.form.get("info", "").strip()
         if name and info:
-            data = GET_PROMPT_DATA()
-            lst = data.setdefault("spieler", [])
-            lst.append({"name": name, "info": info})
-            SAVE_PROMPT_DATA(data)
-            REFRESH_DATA()
-            logger.info("Added player %s", name)
-            return redirect(url_for("player_list"))
+            store = _context().get_store()
+            if store.add_player(Player(name, info)):
+                logger.info("Added player %s", name)
+                return redirect(url_for(".player_list"))
+            logger.warning("Player %s not added: name already taken", name)
+            error = f"Es gibt bereits einen Spieler namens {name}."
+            return render_template("add_player.html", error=error, name=name, info=info), 409
     return render_template("add_player.html")
 
-@app.route("/players/edit/<name>", methods=["GET", "POST"])
+@panel.route("/players/edit/<name>", methods=["GET", "POST"])
 @login_required
 def edit_player(name):
-    data = GET_PROMPT_DATA()
-    players = data.get("spieler", [])
-    pl = next((p for p in players if p["name"] == name), None)
+    store = _context().get_store()
+    pl = store.get_player(name)
     if pl is None:
         logger.warning("Player %s not found", name)
         return "Player not found", 404
     if request.method == "POST":
-        pl["info"] = request.form.get("info", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.update_player(name, request.form.get("info", "").strip())
         logger.info("Edited player %s", name)
-        return redirect(url_for("player_list"))
-    return render_template("edit_player.html", name=name, info=pl.get("info", ""))
+        return redirect(url_for(".player_list"))
+    return render_template("edit_player.html", name=name, info=pl.info)
 
-@app.route("/players/delete/<name>")
+@panel.route("/players/delete/<name>")
 @login_required
 def delete_player(name):
-    data = GET_PROMPT_DATA()
-    players = data.get("spieler", [])
-    data["spieler"] = [p for p in players if p["name"] != name]
-    SAVE_PROMPT_DATA(data)
-    REFRESH_DATA()
+    store = _context().get_store()
+    store.delete_player(name)
     logger.info("Deleted player %s", name)
-    return redirect(url_for("player_list"))
+    return redirect(url_for(".player_list"))
 
-@app.route("/animals")
+@panel.route("/animals")
 @login_required
 def animal_list():
-    data = GET_PROMPT_DATA()
-    animals = sorted(t["name"] for t in data.get("tiere", []))
+    animals = sorted(_context().get_store().animals)
     return render_template("animal_list.html", animals=animals)
 
-@app.route("/animals/add", methods=["GET", "POST"])
+@panel.route("/animals/add", methods=["GET", "POST"])
 @login_required
 def add_animal():
     if request.method == "POST":
         name = request.form.get("name", "").strip()
         info = request.form.get("info", "").strip()
         if name and info:
-            data = GET_PROMPT_DATA()
-            lst = data.setdefault("tiere", [])
-            lst.append({"name": name, "info": info})
-            SAVE_PROMPT_DATA(data)
-            REFRESH_DATA()
-            logger.info("Added animal %s", name)
-            return redirect(url_for("animal_list"))
+            store = _context().get_store()
+            if store.add_animal(Animal(name, info)):
+                logger.info("Added animal %s", name)
+                return redirect(url_for(".animal_list"))
+            logger.warning("Animal %s not added: name already taken", name)
+            error = f"Es gibt bereits ein Tier namens {name}."
+            return render_template("add_animal.html", error=error, name=name, info=info), 409
     return render_template("add_animal.html")
 
-@app.route("/animals/edit/<name>", methods=["GET", "POST"])
+@panel.route("/animals/edit/<name>", methods=["GET", "POST"])
 @login_required
 def edit_animal(name):
-    data = GET_PROMPT_DATA()
-    animals = data.get("tiere", [])
-    an = next((a for a in animals if a["name"] == name), None)
+    store = _context().get_store()
+    an = store.get_animal(name)
     if an is None:
         logger.warning("Animal %s not found", name)
         return "Animal not found", 404
     if request.method == "POST":
-        an["info"] = request.form.get("info", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.update_animal(name, request.form.get("info", "").strip())
         logger.info("Edited animal %s", name)
-        return redirect(url_for("animal_list"))
-    return render_template("edit_animal.html", name=name, info=an.get("info", ""))
+        return redirect(url_for(".animal_list"))
+    return render_template("edit_animal.html", name=name, info=an.info)
 
-@app.route("/animals/delete/<name>")
+@panel.route("/animals/delete/<name>")
 @login_required
 def delete_animal(name):
-    data = GET_PROMPT_DATA()
-    animals = data.get("tiere", [])
-    data["tiere"] = [a for a in animals if a["name"] != name]
-    SAVE_PROMPT_DATA(data)
-    REFRESH_DATA()
+    store = _context().get_store()
+    store.delete_animal(name)
     logger.info("Deleted animal %s", name)
-    return redirect(url_for("animal_list"))
+    return redirect(url_for(".animal_list"))
 
-@app.route("/events")
+@panel.route("/events")
 @login_required
 def event_list():
-    data = GET_PROMPT_DATA()
-    events = data.get("events", [])
+    events = _context().get_store().events
     return render_template("event_list.html", events=events)
 
-@app.route("/events/add", methods=["GET", "POST"])
+@panel.route("/events/add", methods=["GET", "POST"])
 @login_required
 def add_event():
     if request.method == "POST":
         npc = request.form.get("npc", "").strip()
         info = request.form.get("info", "").strip()
         if npc and info:
-            data = GET_PROMPT_DATA()
-            lst = data.setdefault("events", [])
-            lst.append({"npc": npc, "info": info})
-            SAVE_PROMPT_DATA(data)
-            REFRESH_DATA()
+            store = _context().get_store()
+            store.add_event(Event(npc, info))
             logger.info("Added event for NPC %s", npc)
-            return redirect(url_for("event_list"))
+            return redirect(url_for(".event_list"))
     return render_template("add_event.html")
 
-@app.route("/events/delete/<int:index>")
+@panel.route("/events/delete/<int:index>")
 @login_required
 def delete_event(index):
-    data = GET_PROMPT_DATA()
-    events = data.get("events", [])
-    if 0 <= index < len(events):
-        removed = events.pop(index)
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
-        logger.info("Deleted event for NPC %s", removed.get("npc"))
-    return redirect(url_for("event_list"))
-
-@app.route("/world", methods=["GET", "POST"])
+    store = _context().get_store()
+    removed = store.pop_event(index)
+    if removed is not None:
+        logger.info("Deleted event for NPC %s", removed.npc)
+    return redirect(url_for(".event_list"))
+
+@panel.route("/world", methods=["GET", "POST"])
 @login_required
 def edit_world():
-    data = GET_PROMPT_DATA()
+    store = _context().get_store()
     if request.method == "POST":
-        data["welt"] = request.form.get("welt", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.set_welt(request.form.get("welt", "").strip())
         logger.info("World description updated")
-        return redirect(url_for("npc_list"))
+        return redirect(url_for(".npc_list"))
     return render_template(
         "edit_world.html",
-        welt=data.get("welt", ""),
+        welt=store.welt,
     )
 
-@app.route("/core", methods=["GET", "POST"])
+@panel.route("/core", methods=["GET", "POST"])
 @login_required
 def edit_core():
-    data = GET_PROMPT_DATA()
+    store = _context().get_store()
     if request.method == "POST":
-        data["core"] = request.form.get("core", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.set_core(request.form.get("core", "").strip())
         logger.info("Core description updated")
-        return redirect(url_for("npc_list"))
+        return redirect(url_for(".npc_list"))
     return render_template(
         "edit_core.html",
-        core=data.get("core", ""),
+        core=store.core,
     )
 
-@app.route("/weather", methods=["GET", "POST"])
+@panel.route("/weather", methods=["GET", "POST"])
 @login_required
 def edit_weather():
-    data = GET_PROMPT_DATA()
+    store = _context().get_store()
     if request.method == "POST":
-        wt = {str(i): request.form.get(str(i), "").strip() for i in range(1, 21)}
-        data["weather_table"] = wt
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.set_weather_table({i: request.form.get(str(i), "").strip() for i in range(1, 21)})
         logger.info("Weather table updated")
-        return redirect(url_for("prompt_data"))
-    weather = {int(k): v for k, v in data.get("weather_table", {}).items()}
-    return render_template("edit_weather.html", weather=weather)
+        return redirect(url_for(".prompt_data"))
+    return render_template("edit_weather.html", weather=store.weather_table)
 
-@app.route("/users")
+@panel.route("/users")
 @login_required
 def user_list():
-    data = GET_PROMPT_DATA()
-    users = data.get("user_list", {})
+    users = _context().get_store().users
     return render_template("user_list.html", users=users)
 
-@app.route("/users/add", methods=["GET", "POST"])
+@panel.route("/users/add", methods=["GET", "POST"])
 @login_required
 def add_user():
     if request.method == "POST":
         username = request.form.get("username", "").strip()
         character = request.form.get("character", "").strip()
         if username and character:
-            data = GET_PROMPT_DATA()
-            data.setdefault("user_list", {})[username] = character
-            SAVE_PROMPT_DATA(data)
-            REFRESH_DATA()
+            store = _context().get_store()
+            store.set_user(username, character)
             logger.info("Added user %s with character %s", username, character)
-            return redirect(url_for("user_list"))
+            return redirect(url_for(".user_list"))
     return render_template("add_user.html")
 
-@app.route("/users/edit/<username>", methods=["GET", "POST"])
+@panel.route("/users/edit/<username>", methods=["GET", "POST"])
 @login_required
 def edit_user(username):
-    data = GET_PROMPT_DATA()
-    users = data.get("user_list", {})
+    store = _context().get_store()
+    users = store.users
     if username not in users:
         logger.warning("User %s not found", username)
         return "User not found", 404
     if request.method == "POST":
-        users[username] = request.form.get("character", "").strip()
-        SAVE_PROMPT_DATA(data)
-        REFRESH_DATA()
+        store.set_user(username, request.form.get("character", "").strip())
         logger.info("Edited user %s", username)
-        return redirect(url_for("user_list"))
+        return redirect(url_for(".user_list"))
     return render_template("edit_user.html", username=username, character=users[username])
 
-@app.route("/users/delete/<username>")
+@panel.route("/users/delete/<username>")
 @login_required
 def delete_user(username):
-    data = GET_PROMPT_DATA()
-    users = data.get("user_list", {})
-    users.pop(username, None)
-    SAVE_PROMPT_DATA(data)
-    REFRESH_DATA()
-    return redirect(url_for("user_list"))
-
-@app.route("/logs")
+    store = _context().get_store()
+    store.delete_user(username)
+    return redirect(url_for(".user_list"))
+
+@panel.route("/logs")
 @login_required
 def view_logs():
-    log_files = [f for f in os.listdir(LOG_DIR) if f.endswith(".log")]
+    context = _context()
+    log_files = list_log_files(context.log_dir)
     selected_log = request.args.get("log")
-    content = ""
+    level = request.args.get("level", "")
+    text = request.args.get("q", "")
+    before = request.args.get("before", type=int)
+    records = []
+    older = None
     if selected_log in log_files:
-        with open(os.path.join(LOG_DIR, selected_log), "r", encoding="utf-8") as f:
-            content = f.read()
+        page_size = context.config.get("logging", {}).get("viewer_page_size", 200)
+        records, older = read_log_page(
+            os.path.join(context.log_dir, selected_log), before, page_size, level, text
+        )
     return render_template(
         "logs.html",
         log_files=log_files,
+        levels=LEVELS,
         selected_log=selected_log,
-        log_content=content,
+        level=level,
+        query=text,
+        log_content="\n".join(records),
+        older=older,
+        paged=before is not None,
     )
 
-@app.route("/settings", methods=["GET", "POST"])
+@panel.route("/logs/stream")
+@login_required
+def stream_logs():
+    context = _context()
+    selected_log = request.args.get("log")
+    if selected_log not in list_log_files(context.log_dir):
+        return "Log not found", 404
+    if not context.live_tails.acquire(blocking=False):
+        logger.info("Refused live log tail: all slots in use")
+        return "Too many live log views", 503, {"Retry-After": "30"}
+    lines = follow_log(
+        os.path.join(context.log_dir, selected_log),
+        request.args.get("level", ""),
+        request.args.get("q", ""),
+        max_seconds=context.config.get("logging", {}).get("tail_max_seconds", 300),
+    )
+
+    def events():
+        for line in lines:
+            if line is None:
+                yield ": keepalive\n\n"
+            else:
+                yield "".join(f"data: {part}\n" for part in line.split("\n")) + "\n"
+
+    response = Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    response.call_on_close(context.live_tails.release)
+    return response
+
+@panel.route("/settings", methods=["GET", "POST"])
 @login_required
 def settings():
-    config_path = os.path.join(BASE_DIR, "config.json")
+    context = _context()
+    config_path = os.path.join(context.base_dir, "config.json")
     error = None
     if request.method == "POST":
         raw = request.form.get("config", "")
@@ -405,10 +446,12 @@ def settings():
 
             with open(config_path, "w", encoding="utf-8") as f:
                 json.dump(new_config, f, ensure_ascii=False, indent=2)
-            global CONFIG
-            CONFIG = new_config
-            REFRESH_DATA()
-            return redirect(url_for("settings"))
+            # Updated in place since the bot shares this dict; refresh_data
+            # then rebuilds its settings and reloads the campaign data.
+            context.config.clear()
+            context.config.update(new_config)
+            context.refresh_data()
+            return redirect(url_for(".settings"))
         except json.JSONDecodeError:
             error = "Ungültiges JSON."
     with open(config_path, "r", encoding="utf-8") as f:
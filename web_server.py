@@ -0,0 +1,69 @@
+import logging
+import threading
+
+from werkzeug.serving import make_server
+
+try:
+    from waitress import wasyncore
+    from waitress.server import create_server
+except ImportError:
+    create_server = None
+
+logger = logging.getLogger(__name__)
+
+
+class WebServer:
+    """Serves a WSGI app from a background thread and stops it on request.
+
+    Uses waitress (listed in requirements.txt) with a pool of ``threads``
+    workers. If it is missing, a warning is logged and Werkzeug's
+    development server is used instead; it starts a thread per request and
+    ignores ``threads``. Either way requests run outside the Discord event
+    loop, and ``stop`` closes the listening socket and waits up to
+    ``shutdown_timeout`` seconds for requests in flight.
+    """
+
+    def __init__(self, app, host: str, port: int, threads: int = 4, shutdown_timeout: float = 5.0) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.shutdown_timeout = shutdown_timeout
+        self.server = None
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        if create_server is not None:
+            self.server = create_server(self.app, host=self.host, port=self.port, threads=self.threads)
+            target = self.server.run
+            kind = f"waitress with {self.threads} threads"
+        else:
+            logger.warning(
+                "waitress is not installed; falling back to Werkzeug's development server, "
+                "which starts a thread per request and ignores webserver.threads (%d)", self.threads,
+            )
+            self.server = make_server(self.host, self.port, self.app, threaded=True)
+            target = self.server.serve_forever
+            kind = "the Werkzeug development server"
+        self.thread = threading.Thread(target=target, name="web-server", daemon=True)
+        self.thread.start()
+        logger.info("Web panel listening on %s:%s using %s", self.host, self.port, kind)
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        logger.info("Stopping web panel")
+        if create_server is not None:
+            # Stop accepting first but keep the trigger open: requests in
+            # flight still use it to hand their responses back to the loop.
+            wasyncore.dispatcher.close(self.server)
+            self.server.task_dispatcher.shutdown(timeout=self.shutdown_timeout)
+            self.server.close()
+            wasyncore.close_all(self.server._map)
+        else:
+            self.server.shutdown()
+            self.server.server_close()
+        self.thread.join(self.shutdown_timeout)
+        self.thread = None